@@ -9,14 +9,11 @@ License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
 from flask import Flask
-import matplotlib
 from linnote.account import LOGIN
 from linnote.account.utils import LOGIN_MANAGER
 from linnote.core.utils.configuration import load
 from linnote.core.utils import configure as configure_session
-
-
-matplotlib.use('Agg')
+from linnote.core.utils.cache import configure as configure_cache
 
 
 def create_app(name=None, config_path='configuration.ini', blueprints=None):
@@ -42,6 +39,9 @@ def create_app(name=None, config_path='configuration.ini', blueprints=None):
     # Session.
     configure_session(app)
 
+    # Cache of rendered fragments.
+    configure_cache(app)
+
     # Set home.
     app.add_url_rule('/', 'home', LOGIN)
 
@@ -15,6 +15,9 @@ from .controllers import MergeController
 from .controllers import AssessmentResultsController
 from .controllers import AssessmentRankingsController
 from .controllers import AssessmentSettingsController
+from .controllers import RankingHistogramController
+from .controllers import RankingsExportController
+from .controllers import RankingStatisticsController
 
 
 # Create the module.
@@ -30,6 +33,9 @@ SETTINGS = AssessmentSettingsController.as_view('settings')
 RESULTS = AssessmentResultsController.as_view('results')
 MERGER = MergeController.as_view('merger')
 RANKINGS = AssessmentRankingsController.as_view('rankings')
+HISTOGRAM = RankingHistogramController.as_view('histogram')
+STATISTICS = RankingStatisticsController.as_view('statistics')
+EXPORT = RankingsExportController.as_view('export')
 
 # Register views' controllers routes.
 BLUEPRINT.add_url_rule('', view_func=ASSESSMENTS)
@@ -38,4 +44,15 @@ BLUEPRINT.add_url_rule('/merge', view_func=MERGER)
 BLUEPRINT.add_url_rule('/<int:identifier>', view_func=ASSESSMENT)
 BLUEPRINT.add_url_rule('/<int:identifier>/results', view_func=RESULTS)
 BLUEPRINT.add_url_rule('/<int:identifier>/rankings', view_func=RANKINGS)
+BLUEPRINT.add_url_rule(
+    '/<int:identifier>/rankings/<int:ranking>/histogram.svg',
+    view_func=HISTOGRAM)
+BLUEPRINT.add_url_rule(
+    '/<int:identifier>/rankings/<int:ranking>/statistics.json',
+    view_func=STATISTICS)
+BLUEPRINT.add_url_rule(
+    '/<int:identifier>/rankings/export.<extension>', view_func=EXPORT)
+BLUEPRINT.add_url_rule(
+    '/<int:identifier>/rankings/<int:ranking>/export.<extension>',
+    view_func=EXPORT)
 BLUEPRINT.add_url_rule('/<int:identifier>/settings', view_func=SETTINGS)
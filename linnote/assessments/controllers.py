@@ -8,25 +8,39 @@ Author: Anatole Hanniet, 2016-2018.
 License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
-from io import StringIO
-from operator import attrgetter
-from statistics import mean, median
+from json import dumps
 from typing import List
-from flask import redirect, render_template, request, url_for
+from flask import Response, abort, make_response, redirect, render_template
+from flask import request, stream_with_context, url_for
 from flask.views import MethodView
 from flask_login import current_user, login_required
-from matplotlib import pyplot
-from linnote.core.assessment import Assessment
-from linnote.core.user import Group
+from sqlalchemy.orm import joinedload, selectinload
+from linnote.core.assessment import Assessment, Mark
+from linnote.core.histogram import histogram
+from linnote.core.ranking import Ranking, Rank
+from linnote.core.statistics import describe
+from linnote.core.user import Group, Student
 from linnote.core.utils import DATA
-from .logic import load_results, rank
+from linnote.core.utils.http import conditional, stream_template
+from linnote.users.logic import identities_version
+from .logic import iter_results, rank, save_rankings, update_rankings
+from .logic import upsert_results
+from .logic import assessments_version, rankings_version
+from .logic import export_csv, export_xlsx, merge_assessments, synchronize
+from .logic import rescale_assessment, results_version
 from .forms import AssessmentForm, MergeForm, ResultsImportationForm
 
 
+def refresh(identifier: int) -> None:
+    """Compute a merged assessment again if a source changed, and store it."""
+    if synchronize(identifier):
+        DATA().commit()
+
+
 class AssessmentsController(MethodView):
     """Controls assessments view."""
 
-    decorators = [login_required]
+    decorators = [conditional(assessments_version), login_required]
     template = 'assessments/assessments.html'
 
     def get(self):
@@ -78,7 +92,7 @@ class AssessmentController(MethodView):
             groups = None
 
         # Make rankings and persist.
-        assessment.rankings = rank(assessment, groups)
+        save_rankings(assessment, rank(assessment, groups))
         data.commit()
 
 
@@ -109,13 +123,14 @@ class AssessmentCreationController(AssessmentController):
 
             assessment = Assessment(
                 title, scale, precision=precision, creator=current_user)
+            assessment = data.merge(assessment)
 
             if form.results.data:
-                marks = load_results(request.files['results'], form.scale.data)
-                assessment.add_results(marks)
+                data.flush()
+                chunks = iter_results(request.files['results'], form.scale.data)
+                upsert_results(assessment, chunks, correct=False)
                 self.rank(assessment, form.groups.data)
 
-            assessment = data.merge(assessment)
             data.commit()
 
         return redirect(url_for('assessments.assessment', identifier=assessment.identifier))
@@ -144,11 +159,10 @@ class AssessmentSettingsController(AssessmentController):
         if form.validate():
             assessment = self.load(identifier)
             assessment.title = form.title.data
-            assessment.scale = form.coefficient.data
             assessment.precision = form.precision.data
+            rescale_assessment(assessment, form.coefficient.data)
 
             self.rank(assessment, form.groups.data)
-            assessment.rescale(assessment.scale)
             data.commit()
 
         return redirect(url_for('assessments.assessment', identifier=assessment.identifier))
@@ -157,27 +171,38 @@ class AssessmentSettingsController(AssessmentController):
 class AssessmentResultsController(MethodView):
     """Controls assessment's results view."""
 
-    decorators = [login_required]
+    decorators = [conditional(results_version, forms=True), login_required]
     template = 'assessments/assessment/results.html'
 
     def get(self, identifier):
         """Build assessment's results view."""
+        refresh(identifier)
         assessment = self.load(identifier)
         form = ResultsImportationForm()
-        return self.render(assessment=assessment, form=form)
+        return self.render(
+            assessment=assessment, form=form, results=self.results,
+            identities=identities_version())
 
     def post(self, identifier):
         """Import new assessment's results."""
         assessment = self.load(identifier)
+        if assessment.merged:
+            abort(409)
         form = ResultsImportationForm()
+        summary = None
 
         if form.validate():
             data = DATA()
-            marks = load_results(request.files['results'], form.scale.data)
-            assessment.add_results(marks)
-            assessment.rankings = rank(assessment)
+            unknown = set()
+            chunks = iter_results(request.files['results'], form.scale.data,
+                                  unknown=unknown)
+            summary, marks = upsert_results(
+                assessment, chunks, correct=form.update.data, unknown=unknown)
+            update_rankings(assessment, marks)
             data.commit()
-        return self.render(assessment=assessment, form=form)
+        return self.render(assessment=assessment, form=form, summary=summary,
+                           results=self.results,
+                           identities=identities_version())
 
     @staticmethod
     def load(identifier):
@@ -187,6 +212,19 @@ class AssessmentResultsController(MethodView):
         assessment = assessments.get(identifier)
         return assessment
 
+    @staticmethod
+    def results(assessment) -> List[Mark]:
+        """
+        Load assessment's results, their student and students' identity.
+
+        Called by the template only when the results are not in the fragment
+        cache.
+        """
+        data = DATA()
+        query = data.query(Mark).options(
+            joinedload(Mark.student).joinedload(Student.identity))
+        return query.filter(Mark.assessment_id == assessment.identifier).all()
+
     @classmethod
     def render(cls, **kwargs):
         """Render the view."""
@@ -201,27 +239,22 @@ class MergeController(MethodView):
 
     def get(self):
         """Build assessments merging view."""
-        assessments = self.load()
         form = MergeForm()
-        form.assessments.choices = [
-            (a.identifier, a.title) for a in assessments]
+        form.set_assessments(self.load())
         return self.render(form=form)
 
     def post(self):
         """Merge assessments."""
         data = DATA()
-        assessments = self.load()
         form = MergeForm()
-        form.assessments.choices = [
-            (a.identifier, a.title) for a in assessments]
+        form.set_assessments(self.load())
 
         if form.validate() and len(form.assessments.data) > 1:
             assessments = [self.load(a) for a in form.assessments.data]
-            assessment = Assessment.merge(form.title.data, *assessments)
-            assessment.creator = current_user
-            data.add(assessment)
-
-            rank(assessment)
+            assessment = merge_assessments(
+                form.title.data, assessments, weights=form.coefficients(),
+                creator=current_user)
+            save_rankings(assessment, rank(assessment))
 
         data.commit()
         return self.render(form=form)
@@ -235,57 +268,196 @@ class MergeController(MethodView):
         return data.query(Assessment).get(identifier)
 
     @classmethod
-    def render(cls, **kwargs):
+    def render(cls, form, **kwargs):
         """Render the view."""
-        return render_template(cls.template, **kwargs)
+        titles = dict(form.assessments.choices)
+        return render_template(cls.template, form=form, titles=titles,
+                               **kwargs)
 
 
 class AssessmentRankingsController(MethodView):
     """Controls assessment's report view."""
 
+    decorators = [conditional(rankings_version)]
     template = 'assessments/assessment/rankings.html'
 
     def get(self, identifier):
         """Build assessment's rankings view."""
+        refresh(identifier)
         assessment = self.load(identifier)
-        statistics = self.statistics(assessment)
-        histograms = self.histogram(assessment)
-        return self.render(assessment=assessment, statistics=statistics, histograms=histograms)
+        return self.render(assessment=assessment, ranks=self.ranks)
 
     @staticmethod
     def load(identifier):
-        """Load assessment from storage."""
+        """
+        Load assessment, its rankings and their group from storage.
+
+        Ranks are loaded by 'ranks', only for rankings which table is not in
+        the fragment cache.
+        """
         data = DATA()
-        return data.query(Assessment).get(identifier)
+        query = data.query(Assessment).options(
+            selectinload(Assessment.rankings).joinedload(Ranking.group))
+        return query.get(identifier)
+
+    @staticmethod
+    def ranks(ranking, size: int = 1000):
+        """
+        Iterate over ranking's ranks.
+
+        Only the displayed columns are selected, and rows are fetched by
+        batches of 'size' so that ranks are never all held in memory.
+
+        Return: An iterable of rows with 'aid', 'score', 'value' and
+                'position' attributes, in ranking order.
+        """
+        data = DATA()
+        query = data.query(
+            Student.aid, Mark._score.label('score'),
+            Mark.value.label('value'), Rank.position)
+        query = query.join(Mark, Rank.mark_id == Mark.identifier)
+        query = query.join(Student, Mark.student_id == Student.identifier)
+        query = query.filter(Rank.ranking_id == ranking.identifier)
+        query = query.order_by(Rank.position, Rank.identifier)
+        return query.yield_per(size)
 
     def render(self, **kwargs):
-        """Render the view."""
-        return render_template(self.template, **kwargs)
+        """Render the view as a stream, sent ranking by ranking."""
+        return stream_template(
+            self.template, flush=('</h1>', '</section>'), **kwargs)
+
+
+class RankingsExportController(MethodView):
+    """
+    Controls exports of assessment's rankings.
+
+    Exports are streamed: rows are read and sent by blocks, so memory use does
+    not depend on the number of ranks.
+    """
+
+    decorators = [login_required]
+    formats = {
+        'csv': (export_csv, 'text/csv; charset=utf-8'),
+        'xlsx': (export_xlsx, 'application/vnd.openxmlformats-officedocument'
+                              '.spreadsheetml.sheet')}
+
+    def get(self, identifier, extension, ranking=None):
+        """Export all rankings of the assessment, or only one of them."""
+        if extension not in self.formats:
+            abort(404)
+        assessment, rankings = self.load(identifier, ranking)
+        export, mimetype = self.formats[extension]
+
+        if ranking is None:
+            filename = 'classements-{}.{}'.format(identifier, extension)
+        else:
+            filename = 'classement-{}-{}.{}'.format(identifier, ranking, extension)
+        response = Response(
+            stream_with_context(export(assessment, rankings)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = (
+            'attachment; filename="{}"'.format(filename))
+        return response
 
     @staticmethod
-    def histogram(assessment):
-        """Build an histogram of assessment's marks."""
-        for ranking in assessment.rankings:
-            value = attrgetter('mark.value')
-            marks = [value(rank) for rank in ranking]
-            document = StringIO()
-            coefficient = assessment.scale
-            pyplot.figure(figsize=(6, 4))
-            pyplot.hist(marks, bins=coefficient, range=(0, coefficient),
-                        color=(0.80, 0.80, 0.80), histtype="stepfilled")
-            pyplot.title("Répartition des notes")
-            pyplot.savefig(document, format="svg")
-            pyplot.close()
-            document.seek(0)
-            yield "\n".join(document.readlines()[5:-1])
+    def load(identifier, ranking=None):
+        """
+        Load assessment and its rankings, or only one of them.
+
+        Return: A tuple. First item is an <Assessment> object ; second item is
+                the list of its <Ranking> objects.
+        """
+        refresh(identifier)
+        data = DATA()
+        assessment = data.query(Assessment).get(identifier)
+        if assessment is None:
+            abort(404)
+        query = data.query(Ranking).options(joinedload(Ranking.group))
+        query = query.filter(Ranking.assessment_id == identifier)
+        if ranking is not None:
+            query = query.filter(Ranking.identifier == ranking)
+        rankings = query.order_by(Ranking.identifier).all()
+        if not rankings:
+            abort(404)
+        return assessment, rankings
+
+
+class RankingController(MethodView):
+    """
+    Commons methods for controllers of ranking's resources.
+
+    Resources are built from ranking's mark values only. They are sent with an
+    ETag made of the ranking and the version of the assessment, and may be
+    cached by browsers and proxies.
+    """
+
+    max_age = 60
 
     @staticmethod
-    def statistics(assessment):
-        """Build descriptive statistics of assessment's marks."""
-        for ranking in assessment.rankings:
-            marks = [rank.mark for rank in ranking]
-            marks = [mark.value for mark in marks]
-            yield {"size": len(marks), "maximum": max(marks, default=0),
-                   "minimum": min(marks, default=0),
-                   "mean": mean(marks) if marks else 0,
-                   "median": median(marks) if marks else 0}
+    def load(identifier, ranking):
+        """
+        Load the assessment of a ranking.
+
+        Return: An <Assessment> object.
+        """
+        refresh(identifier)
+        data = DATA()
+        assessment = data.query(Assessment).get(identifier)
+        ranking = data.query(Ranking).get(ranking)
+        if ranking is None or ranking.assessment_id != identifier:
+            abort(404)
+        return assessment
+
+    @staticmethod
+    def values(ranking):
+        """
+        Load ranking's mark values.
+
+        Return: The list of mark values in ranking order.
+        """
+        query = DATA().query(Mark.value)
+        query = query.join(Rank, Rank.mark_id == Mark.identifier)
+        query = query.filter(Rank.ranking_id == ranking)
+        query = query.order_by(Rank.position, Rank.identifier)
+        return [value for value, in query]
+
+    @classmethod
+    def respond(cls, body, mimetype, tag):
+        """Build a cacheable response, answering conditional requests."""
+        response = make_response(body)
+        response.mimetype = mimetype
+        response.set_etag(tag)
+        response.cache_control.public = True
+        response.cache_control.max_age = cls.max_age
+        return response.make_conditional(request)
+
+
+class RankingHistogramController(RankingController):
+    """Controls ranking's histogram resource."""
+
+    def get(self, identifier, ranking):
+        """Build an histogram of ranking's marks."""
+        assessment = self.load(identifier, ranking)
+        key = '{}-{}'.format(ranking, assessment.version)
+        document = histogram(
+            key, lambda: self.values(ranking), assessment.scale,
+            title="Répartition des notes")
+        return self.respond(document, 'image/svg+xml', key)
+
+
+class RankingStatisticsController(RankingController):
+    """Controls ranking's descriptive statistics resource."""
+
+    def get(self, identifier, ranking):
+        """
+        Build descriptive statistics of ranking's marks.
+
+        Marks are only read if the statistics of this version of the ranking
+        are not cached yet.
+        """
+        assessment = self.load(identifier, ranking)
+        statistics = describe(
+            DATA(), [ranking], assessment.version,
+            assessment.precision)[ranking]
+        tag = '{}-{}-{}'.format(
+            ranking, assessment.version, assessment.precision)
+        return self.respond(dumps(statistics), 'application/json', tag)
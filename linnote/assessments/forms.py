@@ -10,9 +10,13 @@ License: Mozilla Public License, see 'LICENSE.txt' for details.
 
 from flask_wtf import FlaskForm as Form
 from flask_wtf.file import FileField
-from wtforms.fields import (StringField, FloatField, IntegerField,
-                            SelectMultipleField)
-from wtforms.validators import DataRequired, NumberRange, Optional
+from wtforms import Form as SubForm
+from wtforms.fields import (BooleanField, StringField, FloatField,
+                            IntegerField, SelectMultipleField, FieldList,
+                            FormField)
+from wtforms.validators import (DataRequired, NumberRange, Optional,
+                                ValidationError)
+from wtforms.widgets import HiddenInput
 
 
 class AssessmentForm(Form):
@@ -52,10 +56,30 @@ class ResultsImportationForm(Form):
         'Barème',
         default=20,
         validators=[DataRequired(), NumberRange(min=0)])
+    update = BooleanField(
+        'Corriger les notes existantes',
+        default=False)
+
+
+class WeightForm(SubForm):
+    """Coefficient of an assessment, in the merging form."""
+
+    assessment = IntegerField(
+        widget=HiddenInput(),
+        validators=[DataRequired()])
+    weight = FloatField(
+        'Coefficient',
+        default=1,
+        validators=[Optional()])
 
 
 class MergeForm(Form):
-    """Assessment merging form."""
+    """
+    Assessment merging form.
+
+    Coefficients are entered for each available assessment and identified by
+    it: only those of the selected assessments are used.
+    """
 
     title = StringField(
         'Libellé',
@@ -64,3 +88,44 @@ class MergeForm(Form):
         'Épreuves',
         coerce=int,
         validators=[DataRequired()])
+    weights = FieldList(
+        FormField(WeightForm),
+        'Coefficients')
+
+    def set_assessments(self, assessments) -> None:
+        """
+        Set available assessments, and a coefficient per assessment.
+
+        Coefficients already submitted are kept.
+
+        - assessments:  Collection of <Assessment> objects.
+
+        Return: None.
+        """
+        self.assessments.choices = [
+            (assessment.identifier, assessment.title)
+            for assessment in assessments]
+        if not self.weights.entries:
+            for assessment in assessments:
+                entry = self.weights.append_entry()
+                entry.assessment.data = assessment.identifier
+
+    def validate_weights(self, field):
+        """Check coefficients are positive and refer to known assessments."""
+        choices = {identifier for identifier, _ in self.assessments.choices}
+        for entry in field.entries:
+            if entry.assessment.data not in choices:
+                raise ValidationError('Coefficient d\'une épreuve inconnue.')
+            if entry.weight.data is not None and entry.weight.data <= 0:
+                raise ValidationError('Les coefficients doivent être positifs.')
+
+    def coefficients(self):
+        """
+        Coefficients of the selected assessments, in selection order.
+
+        Return: A list of floats, 1 for an assessment without coefficient.
+        """
+        weights = {entry.assessment.data: entry.weight.data
+                   for entry in self.weights.entries}
+        return [weights[identifier] if weights.get(identifier) is not None
+                else 1 for identifier in self.assessments.data]
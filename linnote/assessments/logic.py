@@ -8,53 +8,779 @@ Author: Anatole Hanniet, 2016-2018.
 License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
+from csv import writer
+from io import StringIO
+from itertools import groupby
 from pathlib import Path
-from typing import List
-from pandas import read_excel
-from linnote.core.assessment import Assessment, Mark
-from linnote.core.ranking import Ranking
-from linnote.core.user import Group, Student
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+from openpyxl import Workbook
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.util import identity_key
+from linnote.core.assessment import Assessment, Mark, Source
+from linnote.core.ranking import Ranking, Rank, update
+from linnote.core.ranking import rank as order
+from linnote.core.user import Group, Profile, Student, USERS_GROUPS
 from linnote.core.utils import DATA
+from linnote.core.utils.cache import FRAGMENTS
+from linnote.core.utils.tabular import BLOCK_SIZE, CHUNK_SIZE, decimal, read
+from linnote.users.logic import identities_version
+
+
+EXPORT_HEADER = ['Anonymat', 'Note brute', 'Note', 'Rang']
 
 
 def load_results(file: Path, scale: int) -> List['Mark']:
     """
     Load marks from a tabular file.
 
-    Currently, only Excel files are supported. The file should follow a
-    predefined, non customizable layout: (1) student identifier, (2) score.
-    Further columns are ignored.
+    Excel (.xlsx, .xls) and delimited text (.csv, .tsv) files are supported,
+    the format is detected from the content of the file. The file should
+    follow a predefined, non customizable layout: (1) student identifier,
+    (2) score. Further columns are ignored.
+
+    - filepath: Path pointing to the file to load.
+    - scale:    Scale used to compute marks from scores.
+    """
+    return [mark for marks in iter_results(file, scale) for mark in marks]
+
+
+def iter_results(file: Path, scale: int, size: int = CHUNK_SIZE,
+                 unknown: Set[int] = None) -> Iterator[List['Mark']]:
+    """
+    Load marks from a tabular file by chunks.
+
+    The file is read 'size' rows at a time and students of each chunk are
+    resolved with batched queries, so memory use does not depend on the size
+    of the file. The layout is the same than for 'load_results'.
 
     - filepath: Path pointing to the file to load.
     - scale:    Scale used to compute marks from scores.
+    - size:     Integer. Number of rows per chunk.
+    - unknown:  Set. If provided, anonymity identifiers matching no student
+                are added to it as chunks are read.
+
+    Yield: Lists of <Mark> objects, referencing their student by identifier
+           only so that they are not added to the session.
+    """
+    fields = ['student_id', 'score']
+    converters = {'student_id': int, 'score': decimal}
+
+    for records in read(file, fields, converters, size):
+        aids = [record['student_id'] for record in records]
+        students, missing = resolve_students(aids)
+        if unknown is not None:
+            unknown.update(missing)
+
+        results = list()
+        for record in records:
+            student = students.get(record['student_id'])
+            if student is not None and record['score'] is not None:
+                mark = Mark(None, record['score'], scale,
+                            student_id=student.identifier)
+                results.append(mark)
+        yield results
+
+
+def upsert_results(assessment: Assessment, chunks: Iterable[List[Mark]],
+                   correct: bool = True, unknown: Set[int] = None
+                   ) -> Tuple[Dict[str, int], List[Tuple]]:
+    """
+    Add new results to the assessment and correct existing ones.
+
+    Marks of students without a result are inserted. If 'correct' is True,
+    marks of students with a different result replace the stored score, else
+    they are ignored. Writes are made in bulk for each chunk: a single
+    'INSERT ... ON DUPLICATE KEY UPDATE' statement on MySQL, an executemany
+    UPDATE and an executemany INSERT on other backends. The summary of the
+    assessment is updated with the changed values only.
+
+    - assessment:   <Assessment> object. A stored assessment.
+    - chunks:       Iterable of lists of <Mark> objects. The imported marks.
+    - correct:      Boolean. Correct existing results.
+    - unknown:      Set. Anonymity identifiers matching no student, filled by
+                    'iter_results' while chunks are read. Optional.
+
+    Return: A tuple. First item is a dictionary counting 'inserted', 'updated'
+            and 'unchanged' results, with the sorted list of 'unknown'
+            anonymity identifiers ; second item is the list of inserted or
+            updated results as (identifier, student_id, score) rows.
+    """
+    data = DATA()
+    rescale_assessment(assessment, assessment.scale)
+
+    query = data.query(
+        Mark.student_id, Mark.identifier, Mark._score, Mark._bonus)
+    query = query.filter(Mark.assessment_id == assessment.identifier)
+    stored = {student: (identifier, score, bonus or 0)
+              for student, identifier, score, bonus in query}
+
+    summary = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    students = set()
+    seen = set()
+    for marks in chunks:
+        inserts, updates = list(), list()
+        added, removed = list(), list()
+        for mark in marks:
+            student = mark.student_id
+            if student in seen:
+                continue
+            seen.add(student)
+            if mark.scale != assessment.scale:
+                mark.rescale(assessment.scale)
+
+            if student not in stored:
+                inserts.append({
+                    'assessment_id': assessment.identifier,
+                    'student_id': student, '_score': mark.score,
+                    '_bonus': mark.bonus, '_scale': mark.scale})
+                added.append(mark.value)
+            elif correct and round(stored[student][1] - mark.score,
+                                   assessment.precision):
+                identifier, score, bonus = stored[student]
+                updates.append({
+                    'identifier': identifier, 'student_id': student,
+                    '_score': mark.score})
+                removed.append(score + bonus)
+                added.append(mark.score + bonus)
+            else:
+                summary['unchanged'] += 1
+
+        _write_results(assessment, inserts, updates)
+        assessment.summarize(added=added, removed=removed)
+        summary['inserted'] += len(inserts)
+        summary['updated'] += len(updates)
+        students.update(row['student_id'] for row in inserts + updates)
+
+    data.expire(assessment, ['results'])
+    summary['unknown'] = sorted(unknown or ())
+
+    query = data.query(
+        Mark.identifier, Mark.student_id, Mark._score.label('score'))
+    query = query.filter(Mark.assessment_id == assessment.identifier)
+    changes = [row for row in query if row.student_id in students]
+    return summary, changes
+
+
+def rescale_assessment(assessment: Assessment, scale: int) -> None:
+    """
+    Change the scale of an assessment, and rescale its results.
+
+    Results are rescaled by a single 'UPDATE marks ... WHERE assessment_id'
+    statement, restricted to results which are not already at the new scale,
+    and marks loaded in the session are expired. The summary is then built
+    again from a single column query, so that its values are exactly the
+    stored ones. With an unchanged scale, stray results are brought back to
+    the scale of the assessment.
+
+    - assessment:   <Assessment> object. A stored assessment.
+    - scale:        Integer. The new scale.
+
+    Return: None.
+    """
+    data = DATA()
+    data.flush()
+
+    # Assignments are ordered: MySQL reads columns assigned before.
+    query = data.query(Mark)
+    query = query.filter(Mark.assessment_id == assessment.identifier)
+    query = query.filter(Mark._scale != scale)
+    count = query.update([
+        (Mark._score, Mark._score * scale / Mark._scale),
+        (Mark._bonus, Mark._bonus * scale / Mark._scale),
+        (Mark._scale, scale)],
+        synchronize_session=False,
+        update_args={'preserve_parameter_order': True})
+
+    # Keep already loaded marks consistent with storage.
+    for mark in list(data.identity_map.values()):
+        if isinstance(mark, Mark) \
+                and mark.__dict__.get('assessment_id') == assessment.identifier:
+            data.expire(mark)
+
+    if count:
+        query = data.query(Mark.value)
+        query = query.filter(Mark.assessment_id == assessment.identifier)
+        assessment.summarize(reset=[value for value, in query])
+    if scale != assessment.scale:
+        assessment.scale = scale
+        assessment.touch()
+
+
+def _write_results(assessment: Assessment, inserts: List[Dict],
+                   updates: List[Dict]) -> None:
+    """Write new and corrected results of an assessment in bulk."""
+    data = DATA()
+    if not inserts and not updates:
+        return
+
+    if data.get_bind().dialect.name == 'mysql':
+        rows = [{'assessment_id': assessment.identifier,
+                 'student_id': row['student_id'], '_score': row['_score'],
+                 '_bonus': 0, '_scale': assessment.scale} for row in updates]
+        statement = mysql_insert(Mark.__table__).values(inserts + rows)
+        statement = statement.on_duplicate_key_update(
+            _score=statement.inserted._score)
+        data.execute(statement)
+    else:
+        data.bulk_update_mappings(
+            Mark, [{'identifier': row['identifier'], '_score': row['_score']}
+                   for row in updates])
+        data.bulk_insert_mappings(Mark, inserts)
+
+    # Keep already loaded marks consistent with storage.
+    for row in updates:
+        mark = data.identity_map.get(identity_key(Mark, row['identifier']))
+        if mark is not None:
+            data.expire(mark)
+
+
+def resolve_students(aids: Iterable[int], size: int = 500
+                     ) -> Tuple[Dict[int, Student], Set[int]]:
+    """
+    Map anonymity identifiers to students.
+
+    Students are fetched by batches of 'size' identifiers, each batch being
+    resolved with a single 'IN' query instead of one query per identifier.
+
+    - aids: Collection of integers. Anonymity identifiers to resolve.
+    - size: Integer. Maximal number of identifiers per query.
+
+    Return: A tuple. First item is a dictionary mapping anonymity identifiers
+            to <Student> objects ; second item is the set of anonymity
+            identifiers that match no student.
+    """
+    data = DATA()
+    aids = list(set(aids))
+
+    students = dict()
+    for index in range(0, len(aids), size):
+        batch = aids[index:index + size]
+        query = data.query(Student).filter(Student.aid.in_(batch))
+        students.update((student.aid, student) for student in query)
+
+    unknown = set(aids) - students.keys()
+    return students, unknown
+
+
+def load_memberships(groups: List[Group]) -> Dict[int, Set[int]]:
+    """
+    Load students membership of groups.
+
+    Memberships of every group are fetched with a single query.
+
+    - groups:   Collection of <Group> objects.
+
+    Return: A dictionary mapping groups identifier to the set of identifiers
+            of their students.
+    """
+    data = DATA()
+    memberships = {group.identifier: set() for group in groups}
+
+    query = data.query(USERS_GROUPS.c.group, Profile.identifier)
+    query = query.join(Profile, Profile.user_id == USERS_GROUPS.c.user)
+    query = query.filter(Profile.role == 'student')
+    query = query.filter(USERS_GROUPS.c.group.in_(list(memberships)))
+    for group_id, student_id in query:
+        memberships[group_id].add(student_id)
+    return memberships
+
+
+def assessments_version() -> str:
+    """
+    Version of the list of assessments.
+
+    Return: A string changing whenever an assessment is created, deleted or
+            modified.
+    """
+    data = DATA()
+    query = data.query(
+        func.count(Assessment.identifier), func.max(Assessment.identifier),
+        func.sum(Assessment.version))
+    return '{}-{}-{}'.format(*query.one())
+
+
+def assessment_version(identifier: int, **_) -> str:
+    """
+    Version of an assessment, read without loading the assessment.
+
+    Return: A string, or None if the assessment does not exist.
     """
     data = DATA()
-    records = read_excel(
-        file, names=['student_id', 'score'], usecols=[0, 1],
-        converters={'student_id': int, 'score': float})
-    records = records.to_dict(orient='list')
+    query = data.query(Assessment.version, _sources_version())
+    version, sources = query.filter(
+        Assessment.identifier == identifier).one_or_none() or (None, None)
+    if version is None:
+        return None
+    return '{}-{}-{}'.format(identifier, version, sources)
+
+
+def results_version(identifier: int, **_) -> str:
+    """
+    Version of assessment's results page, which shows students' names.
+
+    Return: A string, or None if the assessment does not exist.
+    """
+    version = assessment_version(identifier)
+    if version is None:
+        return None
+    return '{}-{}'.format(version, identities_version())
 
-    results = list()
-    for student_id, score in zip(records['student_id'], records['score']):
-        student = data.query(Student).filter_by(aid=student_id).first()
-        if student is not None:
-            mark = Mark(student, score, scale)
-            results.append(mark)
-    return results
+
+def rankings_version(identifier: int, **_) -> str:
+    """
+    Version of assessment's rankings, including the version of their groups.
+
+    Return: A string, or None if the assessment does not exist.
+    """
+    data = DATA()
+    query = data.query(
+        Assessment.version, _sources_version(), func.sum(Group.version))
+    query = query.outerjoin(Ranking, Ranking.assessment_id == Assessment.identifier)
+    query = query.outerjoin(Group, Group.identifier == Ranking.group_id)
+    query = query.filter(Assessment.identifier == identifier)
+    version, sources, groups = query.group_by(
+        Assessment.identifier).one_or_none() or (None, None, None)
+    if version is None:
+        return None
+    return '{}-{}-{}-{}'.format(identifier, version, sources, groups or 0)
+
+
+def _sources_version():
+    """
+    Sum of the versions of the sources of the queried assessment.
+
+    Versions only increase, so the sum changes whenever a source changes.
+
+    Return: A correlated scalar subquery.
+    """
+    source = aliased(Assessment)
+    query = select([func.coalesce(func.sum(source.version), 0)])
+    query = query.select_from(
+        Source.__table__.join(source, source.identifier == Source.source_id))
+    query = query.where(Source.merged_id == Assessment.identifier)
+    return query.correlate(Assessment).as_scalar()
 
 
 def rank(assessment: Assessment, groups: List[Group] = None) -> List[Ranking]:
-    """(Re)generate rankings for the assessment."""
+    """
+    (Re)generate rankings for the assessment.
+
+    Results are read with a column query on marks, no <Mark> object is
+    loaded.
+    """
+    data = DATA()
+    data.flush()
     rankings = list()
 
     # General ranking (included all participating students).
-    ranking_general = Ranking(assessment)
+    query = data.query(
+        Mark.identifier, Mark.student_id, Mark._score.label('score'))
+    query = query.filter(Mark.assessment_id == assessment.identifier)
+    results = query.order_by(Mark.identifier).all()
+    indices, _ = order(
+        [result.score for result in results], precision=assessment.precision)
+    results = [results[index] for index in indices.tolist()]
+    ranking_general = Ranking(assessment, ordered=results)
     rankings.append(ranking_general)
 
-    # Ranking analysis on groups of the participating students.
-    if groups is not None:
+    # Ranking analysis on groups of the participating students, derived from
+    # the general ranking.
+    if groups:
+        memberships = load_memberships(groups)
         for group in groups:
-            ranking = Ranking(assessment, group)
+            members = memberships[group.identifier]
+            ranking = ranking_general.subset(group, members)
             rankings.append(ranking)
 
     return rankings
+
+
+def merge_assessments(title: str, assessments: List[Assessment],
+                      weights: List[float] = None, **kwargs) -> Assessment:
+    """
+    Merge assessments into a new one, in the database.
+
+    Marks of the new assessment are computed and written by a single
+    'INSERT ... SELECT ... GROUP BY student_id' statement, which also weights
+    and rescales them to the scale of the new assessment: marks do not go
+    through Python, and no weighted copy of the sources is stored.
+
+    - title:        String. Title of the new assessment.
+    - assessments:  Collection of stored <Assessment> objects. The sources.
+    - weights:      Collection of floats. Coefficient of each source,
+                    default to 1.
+    * creator:      <User> object. Creator of the new assessment.
+
+    Return: The new <Assessment> object, stored.
+    """
+    data = DATA()
+    data.flush()
+    if weights is None:
+        weights = [1] * len(assessments)
+    scale = Source.merged_scale(assessments, weights)
+    precision = min(assessment.precision for assessment in assessments)
+
+    merged = Assessment(title, scale, precision=precision,
+                        creator=kwargs.get('creator'))
+    merged.sources = [Source(assessment, weight) for assessment, weight
+                      in zip(assessments, weights)]
+    data.add(merged)
+    data.flush()
+
+    results = _merged_results(merged, literal(merged.identifier))
+    data.execute(insert(Mark.__table__).from_select(
+        ['assessment_id', 'student_id', '_score', '_bonus', '_scale'],
+        results))
+
+    query = data.query(Mark.value)
+    query = query.filter(Mark.assessment_id == merged.identifier)
+    merged.summarize(reset=[value for value, in query])
+    return merged
+
+
+def _merged_results(merged: Assessment, *prefix):
+    """
+    Compute results of a merged assessment from its sources.
+
+    Scores, bonuses and scales of each student are multiplied by the weight of
+    their source and summed, then rescaled to the scale of the merged
+    assessment.
+
+    - merged:   <Assessment> object. The merged assessment, stored with its
+                sources.
+    - prefix:   Columns to select before the results.
+
+    Return: A SELECT statement of student_id, score, bonus and scale columns.
+    """
+    scale = merged.scale
+    ratio = float(scale) / func.sum(Mark._scale * Source.weight)
+    results = select(list(prefix) + [
+        Mark.student_id, func.sum(Mark._score * Source.weight) * ratio,
+        func.sum(func.coalesce(Mark._bonus, 0) * Source.weight) * ratio,
+        literal(scale)])
+    results = results.select_from(Mark.__table__.join(
+        Source.__table__, Source.source_id == Mark.assessment_id))
+    results = results.where(Source.merged_id == merged.identifier)
+    return results.group_by(Mark.student_id)
+
+
+def synchronize(identifier: int) -> bool:
+    """
+    Compute a merged assessment again if one of its sources changed.
+
+    Merged results are computed from the sources by the database, then
+    compared to the stored ones: only results of affected students are
+    written, and rankings are updated with these results only. The merged
+    assessment is locked while it is computed, so concurrent requests do not
+    compute it twice.
+
+    - identifier:   Integer. Identifier of an assessment. Nothing is done if
+                    it is not a merged assessment.
+
+    Return: True if the merged assessment was computed again.
+    """
+    data = DATA()
+    source = aliased(Assessment)
+    query = data.query(Source.seen, source.version)
+    query = query.join(source, source.identifier == Source.source_id)
+    query = query.filter(Source.merged_id == identifier)
+    if all(seen == version for seen, version in query):
+        return False
+
+    query = data.query(Assessment).filter(Assessment.identifier == identifier)
+    merged = query.with_for_update().populate_existing().one()
+    for link in merged.sources:
+        data.refresh(link)
+        data.refresh(link.source)
+    if not any(link.stale for link in merged.sources):
+        return False
+
+    # Results are rescaled by the query to the scale of the merged assessment,
+    # which may have been changed since its creation.
+    scale = merged.scale
+
+    query = data.query(
+        Mark.student_id, Mark.identifier, Mark._score, Mark._bonus)
+    query = query.filter(Mark.assessment_id == identifier)
+    stored = {row[0]: row[1:] for row in query}
+    computed = {row[0]: row[1:3] for row in data.execute(_merged_results(merged))}
+
+    inserts, updates, added, removed = list(), list(), list(), list()
+    for student, (score, bonus) in computed.items():
+        if student not in stored:
+            inserts.append({
+                'assessment_id': identifier, 'student_id': student,
+                '_score': score, '_bonus': bonus, '_scale': scale})
+            added.append(score + bonus)
+            continue
+        mark, previous, bonus_previous = stored[student]
+        bonus_previous = bonus_previous or 0
+        if abs(previous - score) > 1e-9 \
+                or abs(bonus_previous - bonus) > 1e-9:
+            updates.append({
+                'identifier': mark, '_score': score, '_bonus': bonus,
+                '_scale': scale})
+            removed.append(previous + bonus_previous)
+            added.append(score + bonus)
+    deletes = [row[0] for student, row in stored.items()
+               if student not in computed]
+    removed.extend(stored[student][1] + (stored[student][2] or 0)
+                   for student in stored if student not in computed)
+
+    # Write affected results only.
+    data.bulk_update_mappings(Mark, updates)
+    data.bulk_insert_mappings(Mark, inserts)
+    if deletes:
+        ranks = data.query(Rank).filter(Rank.mark_id.in_(deletes))
+        ranks.delete(synchronize_session='fetch')
+        marks = data.query(Mark).filter(Mark.identifier.in_(deletes))
+        marks.delete(synchronize_session='fetch')
+    for row in updates:
+        mark = data.identity_map.get(identity_key(Mark, row['identifier']))
+        if mark is not None:
+            data.expire(mark)
+    data.expire(merged, ['results'])
+
+    merged.summarize(added=added, removed=removed)
+    for link in merged.sources:
+        link.seen = link.source.version
+    data.flush()
+
+    # Removed results shift every following rank: rank from scratch.
+    if deletes:
+        groups = [ranking.group for ranking in merged.rankings
+                  if ranking.group_id is not None]
+        save_rankings(merged, rank(merged, groups))
+    else:
+        students = {row['student_id'] for row in inserts}
+        marks = {row['identifier'] for row in updates}
+        query = data.query(
+            Mark.identifier, Mark.student_id, Mark._score.label('score'))
+        query = query.filter(Mark.assessment_id == identifier)
+        update_rankings(merged, [
+            row for row in query
+            if row.student_id in students or row.identifier in marks])
+    return True
+
+
+def save_rankings(assessment: Assessment, rankings: List[Ranking]) -> None:
+    """
+    Replace assessment's rankings in storage.
+
+    Previous rankings and their ranks are removed with set-based DELETE
+    statements, new ranks are written with a single executemany INSERT. All
+    statements run in the session's transaction, so other readers only see the
+    new rankings once the session is committed.
+
+    - assessment:   <Assessment> object. The ranked assessment.
+    - rankings:     Collection of <Ranking> objects. The new rankings.
+
+    Return: None.
+    """
+    data = DATA()
+    data.flush()
+
+    # Remove previous rankings.
+    previous = data.query(Ranking.identifier)
+    previous = previous.filter(Ranking.assessment_id == assessment.identifier)
+    previous = [identifier for identifier, in previous]
+    if previous:
+        ranks = data.query(Rank).filter(Rank.ranking_id.in_(previous))
+        ranks.delete(synchronize_session='fetch')
+        olds = data.query(Ranking).filter(Ranking.identifier.in_(previous))
+        olds.delete(synchronize_session='fetch')
+
+    # Write new rankings, then their ranks.
+    for ranking in rankings:
+        ranking.assessment = assessment
+    data.flush()
+
+    ranks = [
+        {'ranking_id': ranking.identifier, 'mark_id': mark.identifier,
+         'position': position}
+        for ranking in rankings
+        for mark, position in zip(ranking.results, ranking.positions)]
+    data.bulk_insert_mappings(Rank, ranks)
+
+    data.expire(assessment, ['rankings'])
+    for ranking in rankings:
+        data.expire(ranking, ['ranks'])
+    assessment.touch()
+    FRAGMENTS.invalidate('assessment-{}'.format(assessment.identifier))
+
+
+def update_rankings(assessment: Assessment, marks: List[Mark]) -> None:
+    """
+    Update assessment's rankings after some of its results changed.
+
+    New or modified marks are moved into the existing order of each ranking,
+    and only ranks which position actually changed are written. If the
+    assessment has not been ranked yet, rankings are generated from scratch.
+
+    - assessment:   <Assessment> object. The ranked assessment.
+    - marks:        Collection of <Mark> objects, or of rows with the same
+                    'identifier', 'student_id' and 'score' attributes. Added
+                    or modified results.
+
+    Return: None.
+    """
+    data = DATA()
+    data.flush()
+
+    rankings = data.query(Ranking)
+    rankings = rankings.filter(Ranking.assessment_id == assessment.identifier)
+    rankings = rankings.order_by(Ranking.identifier).all()
+    if not rankings:
+        save_rankings(assessment, rank(assessment))
+        return
+
+    groups = [ranking.group for ranking in rankings
+              if ranking.group_id is not None]
+    memberships = load_memberships(groups)
+
+    # Existing ranks of every ranking, in ranking order.
+    query = data.query(
+        Rank.ranking_id, Rank.identifier, Rank.mark_id, Rank.position,
+        Mark._score.label('score'))
+    query = query.join(Rank.mark)
+    query = query.filter(Rank.ranking_id.in_([r.identifier for r in rankings]))
+    query = query.order_by(Rank.ranking_id, Rank.position, Rank.identifier)
+    ranks = {ranking_id: list(rows)
+             for ranking_id, rows in groupby(query, lambda row: row[0])}
+
+    updates, inserts = list(), list()
+    for ranking in rankings:
+        rows = ranks.get(ranking.identifier, [])
+        known = {row.mark_id: (row.identifier, row.position) for row in rows}
+
+        changes = marks
+        if ranking.group_id is not None:
+            members = memberships[ranking.group_id]
+            changes = [mark for mark in marks if mark.student_id in members]
+        changes = {mark.identifier: mark.score for mark in changes}
+        if not changes:
+            continue
+
+        identifiers, positions = update(
+            [(row.mark_id, row.score) for row in rows], changes,
+            precision=assessment.precision)
+        for mark_id, position in zip(identifiers, positions.tolist()):
+            if mark_id not in known:
+                inserts.append({
+                    'ranking_id': ranking.identifier, 'mark_id': mark_id,
+                    'position': position})
+            elif known[mark_id][1] != position:
+                updates.append({
+                    'identifier': known[mark_id][0], 'position': position})
+
+    data.bulk_update_mappings(Rank, updates)
+    data.bulk_insert_mappings(Rank, inserts)
+
+    for ranking in rankings:
+        data.expire(ranking, ['ranks'])
+    if updates or inserts:
+        assessment.touch()
+        FRAGMENTS.invalidate('assessment-{}'.format(assessment.identifier))
+
+
+def iter_ranks(rankings: List[Ranking], size: int = CHUNK_SIZE
+               ) -> Iterator[Tuple]:
+    """
+    Iterate over ranks of rankings.
+
+    Only exported columns are selected and rows are fetched by batches of
+    'size', so that ranks are never all held in memory.
+
+    - rankings: Collection of <Ranking> objects.
+    - size:     Integer. Number of rows fetched at once.
+
+    Yield: Tuples (ranking identifier, aid, score, value, position), ranking
+           by ranking and in ranking order.
+    """
+    data = DATA()
+    query = data.query(
+        Rank.ranking_id, Student.aid, Mark._score, Mark.value, Rank.position)
+    query = query.join(Mark, Rank.mark_id == Mark.identifier)
+    query = query.join(Student, Mark.student_id == Student.identifier)
+    query = query.filter(
+        Rank.ranking_id.in_([ranking.identifier for ranking in rankings]))
+    query = query.order_by(Rank.ranking_id, Rank.position, Rank.identifier)
+    return query.yield_per(size)
+
+
+def ranking_name(ranking: Ranking) -> str:
+    """Name of a ranking, as displayed to users."""
+    return ranking.group.name if ranking.group_id is not None else 'Général'
+
+
+def export_csv(assessment: Assessment, rankings: List[Ranking]
+               ) -> Iterator[str]:
+    """
+    Export rankings as a semicolon delimited text file, by parts.
+
+    The header is yielded at once, then rows are buffered and yielded by
+    blocks. When several rankings are exported, a first column holds the
+    name of the ranking.
+
+    - assessment:   <Assessment> object. The ranked assessment.
+    - rankings:     Collection of <Ranking> objects, of the assessment.
+
+    Yield: Strings.
+    """
+    names = {ranking.identifier: ranking_name(ranking) for ranking in rankings}
+    single = len(rankings) == 1
+    precision = assessment.precision
+
+    buffer = StringIO()
+    rows = writer(buffer, delimiter=';', lineterminator='\r\n')
+    rows.writerow(EXPORT_HEADER if single else ['Classement'] + EXPORT_HEADER)
+    yield '\ufeff' + buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for ranking, aid, score, value, position in iter_ranks(rankings):
+        row = [aid, round(score, precision), round(value, precision), position]
+        rows.writerow(row if single else [names[ranking]] + row)
+        if buffer.tell() >= BLOCK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_xlsx(assessment: Assessment, rankings: List[Ranking]
+                ) -> Iterator[bytes]:
+    """
+    Export rankings as an Excel workbook, one sheet per ranking, by parts.
+
+    The workbook is written in write-only mode: rows are flushed to a
+    temporary file as they are appended. The archive can only be sent once
+    it is complete, it is spooled to disk when it gets large.
+
+    - assessment:   <Assessment> object. The ranked assessment.
+    - rankings:     Collection of <Ranking> objects, of the assessment.
+
+    Yield: Bytes.
+    """
+    names = {ranking.identifier: ranking_name(ranking) for ranking in rankings}
+    precision = assessment.precision
+
+    workbook = Workbook(write_only=True)
+    sheets = dict()
+    for ranking in rankings:
+        title = names[ranking.identifier]
+        title = ''.join(char for char in title if char not in '[]:*?/\\')
+        sheets[ranking.identifier] = workbook.create_sheet(title[:31] or None)
+        sheets[ranking.identifier].append(EXPORT_HEADER)
+
+    for ranking, aid, score, value, position in iter_ranks(rankings):
+        sheets[ranking].append(
+            [aid, round(score, precision), round(value, precision), position])
+
+    with SpooledTemporaryFile(max_size=BLOCK_SIZE * 16) as file:
+        workbook.save(file)
+        file.seek(0)
+        yield from iter(lambda: file.read(BLOCK_SIZE), b'')
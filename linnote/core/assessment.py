@@ -13,12 +13,15 @@ License: Mozilla Public License, see 'LICENSE.txt' for details.
 
 from abc import ABC, abstractmethod
 from copy import copy
-from itertools import groupby
 from operator import attrgetter
-from typing import List
-from sqlalchemy import Column
+from math import sqrt
+from typing import Iterable, List, Set, Tuple
+import numpy
+from sqlalchemy import Column, UniqueConstraint
 from sqlalchemy import Integer, Float, ForeignKey, String, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import LargeBinary, func
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import deferred, object_session, relationship
 from sqlalchemy.sql.functions import current_timestamp
 from .utils import BASE
 
@@ -33,6 +36,9 @@ class Mark(BASE):
     """
 
     __tablename__ = 'marks'
+    __table_args__ = (
+        UniqueConstraint('assessment_id', 'student_id',
+                         name='uq_marks_assessment_student'),)
 
     identifier = Column(Integer, primary_key=True)
     assessment_id = Column(Integer, ForeignKey('assessments.identifier'))
@@ -49,14 +55,21 @@ class Mark(BASE):
         Create a new mark.
 
         - student:      <Student> object. The student that has obtain the mark.
+                        May be None if 'student_id' is provided.
         - score:        Float. Student's score for the assessment.
         - scale:        Numeric. Maximal possible score for the assessment.
         * bonus:        Float. Student's bonus points for the assessment.
+        * student_id:   Integer. Identifier of the student, used instead of
+                        'student' to avoid loading students.
 
         Return: None.
         """
         super().__init__()
-        self.student = student
+        if student is not None:
+            self.student = student
+            self.student_id = student.identifier
+        else:
+            self.student_id = kwargs['student_id']
         self._scale = scale
         self._score = score
         self._bonus = kwargs.get('bonus', 0)
@@ -93,7 +106,7 @@ class Mark(BASE):
         return NotImplemented
 
     def __add__(self, other):
-        if isinstance(other, Mark) and self.student == other.student:
+        if isinstance(other, Mark) and _student(self) == _student(other):
             result = copy(self)
             result._score += other.score
             result._bonus += other.bonus
@@ -110,6 +123,9 @@ class Mark(BASE):
         return self.__add__(other)
 
     def __copy__(self):
+        if self.student_id is not None:
+            return Mark(None, self.score, self.scale, bonus=self.bonus,
+                        student_id=self.student_id)
         return Mark(self.student, self.score, self.scale, bonus=self.bonus)
 
     def __hash__(self) -> int:
@@ -130,15 +146,35 @@ class Mark(BASE):
         """
         Merge student results for each students.
 
+        Scores, bonuses and scales of each student are summed with 'aggregate'
+        and exactly one new mark is created per student.
+
         - args: List of Mark list. Results list to merge.
         """
-        student = attrgetter('student.identifier')
-
         results = [result for results in args for result in results]
-        results.sort(key=student)
-        results = [sum(marks) for _, marks in groupby(results, student)]
+        students, scores, bonuses, scales = aggregate(
+            [_student(mark) for mark in results],
+            [mark.score for mark in results],
+            [mark.bonus or 0 for mark in results],
+            [mark.scale for mark in results])
+        return Mark.build(students, scores, bonuses, scales)
+
+    @staticmethod
+    def build(students, scores, bonuses, scales) -> List['Mark']:
+        """
+        Create marks from columns of values.
 
-        return results
+        - students: Sequence of integers. Identifiers of the students.
+        - scores:   Sequence of floats.
+        - bonuses:  Sequence of floats.
+        - scales:   Sequence of numbers.
+
+        Return: A list of <Mark> objects, one per item of the sequences.
+        """
+        columns = (numpy.asarray(column).tolist()
+                   for column in (students, scores, bonuses, scales))
+        return [Mark(None, score, scale, bonus=bonus, student_id=student)
+                for student, score, bonus, scale in zip(*columns)]
 
     def rescale(self, scale):
         """
@@ -167,11 +203,101 @@ class Mark(BASE):
         """Change the score value."""
         self._score = value
 
-    @property
+    @hybrid_property
     def value(self):
         """The processed mark, including bonus points."""
         return self._score + self._bonus
 
+    @value.expression
+    def value(cls):
+        """The processed mark, including bonus points."""
+        return cls._score + func.coalesce(cls._bonus, 0)
+
+
+def aggregate(students, scores, bonuses, scales,
+              weights=None) -> Tuple[numpy.ndarray, ...]:
+    """
+    Sum scores, bonuses and scales of each student.
+
+    Values are grouped by student with a single sort, and summed with
+    vectorized reductions.
+
+    - students: Sequence of integers. Identifier of the student of each mark.
+    - scores:   Sequence of floats. Score of each mark.
+    - bonuses:  Sequence of floats. Bonus of each mark.
+    - scales:   Sequence of numbers. Scale of each mark.
+    - weights:  Sequence of floats. Coefficient of each mark, applied to its
+                score, bonus and scale. Optional, default to 1.
+
+    Return: A tuple of arrays: identifiers of the students, in ascending
+            order, then their summed scores, bonuses and scales.
+    """
+    students = numpy.asarray(students, dtype=numpy.int64)
+    identifiers, groups = numpy.unique(students, return_inverse=True)
+    if weights is not None:
+        weights = numpy.asarray(weights, dtype=float)
+
+    def total(values):
+        """Sum values of each group."""
+        values = numpy.asarray(values, dtype=float)
+        if weights is not None:
+            values = values * weights
+        return numpy.bincount(groups, values, minlength=identifiers.size)
+
+    return identifiers, total(scores), total(bonuses), total(scales)
+
+
+def _student(mark: Mark) -> int:
+    """Identifier of mark's student, without loading the student if known."""
+    if mark.student_id is not None:
+        return mark.student_id
+    return mark.student.identifier
+
+
+def _columns(assessments, weights=None) -> Tuple[List, ...]:
+    """
+    Results of assessments as columns of values.
+
+    Stored assessments are read with a single column query, without loading
+    marks nor students.
+
+    - assessments:  Collection of <Assessment> objects.
+    - weights:      Collection of floats. Coefficient of each assessment.
+                    Optional, default to 1.
+
+    Return: A tuple of lists: students identifier, scores, bonuses, scales
+            and coefficients.
+    """
+    if weights is None:
+        weights = [1] * len(assessments)
+    stored = [assessment for assessment in assessments
+              if object_session(assessment) is not None
+              and assessment.identifier is not None]
+    coefficients = {assessment.identifier: weight
+                    for assessment, weight in zip(assessments, weights)
+                    if assessment in stored}
+    rows = list()
+    if stored:
+        session = object_session(stored[0])
+        session.flush()
+        query = session.query(
+            Mark.student_id, Mark._score, Mark._bonus, Mark._scale,
+            Mark.assessment_id)
+        query = query.filter(Mark.assessment_id.in_(
+            [assessment.identifier for assessment in stored]))
+        rows.extend(row[:4] + (coefficients[row[4]],) for row in query)
+
+    for assessment, weight in zip(assessments, weights):
+        if assessment not in stored:
+            rows.extend(
+                (_student(mark), mark.score, mark.bonus, mark.scale, weight)
+                for mark in assessment.results)
+
+    students, scores, bonuses, scales, weights = \
+        tuple(zip(*rows)) or ((),) * 5
+    return (students, scores, [bonus or 0 for bonus in bonuses], scales,
+            weights)
+
 
 class Grader(ABC):
     """
@@ -234,6 +360,16 @@ class Assessment(BASE):
                     computations.
     - results:      Collection of Mark. Students marks to the assessment.
     - reports:      Collection of Report.
+    - version:      Integer. Incremented each time the assessment, its results
+                    or its rankings are modified.
+    - sources:      Collection of Source. For merged assessments, the merged
+                    assessments.
+
+    A summary of marks values (size, mean, sum of squared deviations, minimum
+    and maximum) is stored with the assessment and kept up to date when results
+    change, so that descriptive statistics are available without reading the
+    marks. The sorted values are stored too, in a deferred column, for order
+    statistics.
     """
 
     __tablename__ = 'assessments'
@@ -245,10 +381,23 @@ class Assessment(BASE):
     creator_id = Column(Integer, ForeignKey('users.identifier'))
     creation_date = Column(
         DateTime, nullable=False, server_default=current_timestamp())
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    _size = Column(Integer, nullable=False, default=0, server_default='0')
+    _mean = Column(Float, nullable=False, default=0, server_default='0')
+    _deviations = Column(Float, nullable=False, default=0, server_default='0')
+    _minimum = Column(Float)
+    _maximum = Column(Float)
+    _values = deferred(Column(LargeBinary(2 ** 24 - 1)))
 
     creator = relationship('User', uselist=False)
     results = relationship('Mark', back_populates='assessment', cascade='all')
     rankings = relationship('Ranking', back_populates='assessment', cascade='all')
+    sources = relationship(
+        'Source', foreign_keys='Source.merged_id', back_populates='merged',
+        cascade='all, delete-orphan')
+    derivations = relationship(
+        'Source', foreign_keys='Source.source_id', back_populates='source',
+        cascade='all, delete-orphan')
 
     def __init__(self, title: str, scale: int, **kwargs) -> None:
         super().__init__()
@@ -274,13 +423,14 @@ class Assessment(BASE):
         assessment scale, the mark is automatically rescale before being
         added.
         """
-        if mark.student not in self.attendees:
-            if mark.scale is not self.scale:
-                mark.rescale(self.scale)
-            self.results.append(mark)
-        raise AttributeError('a result is already known for this student')
-
-    def add_results(self, marks: List[Mark]) -> None:
+        if _student(mark) in self.attendance:
+            raise AttributeError('a result is already known for this student')
+        if mark.scale != self.scale:
+            mark.rescale(self.scale)
+        self.results.append(mark)
+        self.summarize(added=[mark.value])
+
+    def add_results(self, marks: List[Mark]) -> List[Mark]:
         """
         Add a collection of results to the assessment.
 
@@ -289,13 +439,32 @@ class Assessment(BASE):
         Ensure that there is not an assessment's result for the student. If
         the mark scale is not equal to the assessment scale, the mark is
         automatically rescale before being added.
+
+        Return: The list of marks actually added.
         """
-        attendees = self.attendees
-        marks = [mark for mark in marks if mark.student not in attendees]
-        if marks[0].scale is not self.scale:
-            for mark in marks:
+        attendance = self.attendance
+        added = list()
+        for mark in marks:
+            student = _student(mark)
+            if student in attendance:
+                continue
+            attendance.add(student)
+            if mark.scale != self.scale:
                 mark.rescale(self.scale)
-        self.results.extend(marks)
+            added.append(mark)
+        self.results.extend(added)
+        self.summarize(added=[mark.value for mark in added])
+        return added
+
+    @property
+    def merged(self) -> bool:
+        """
+        True for merged assessments.
+
+        Results of merged assessments are computed from their sources, and
+        computed again when a source changes: they are not modified directly.
+        """
+        return bool(self.sources)
 
     @property
     def attendees(self) -> List['Student']:
@@ -306,12 +475,29 @@ class Assessment(BASE):
         attendees = map(get_student, self.results)
         return list(attendees)
 
+    @property
+    def attendance(self) -> Set[int]:
+        """
+        Identifiers of students that have taken the assessment.
+
+        For a stored assessment, identifiers are read with a single query on
+        marks' student column, without loading marks nor students.
+        """
+        session = object_session(self)
+        if session is None or self.identifier is None:
+            return {_student(mark) for mark in self.results}
+
+        query = session.query(Mark.student_id)
+        query = query.filter(Mark.assessment_id == self.identifier)
+        return {student for student, in query}
+
     def grade(self, name: str) -> None:
         """Grade the assessment."""
         graders = {'top_linear': TopLinear}
         grader = getattr(graders, name, TopLinear)
         grader = grader(self.results)
         grader.apply(self.results)
+        self.summarize(reset=[mark.value for mark in self.results])
 
     @property
     def expected(self) -> List['Student']:
@@ -321,26 +507,39 @@ class Assessment(BASE):
         raise NotImplementedError
 
     @classmethod
-    def merge(cls, title: str, *assessments) -> 'Assessment':
+    def merge(cls, title: str, *assessments, weights=None) -> 'Assessment':
         """
         Merge multiple assessments into one.
 
         Create a new Assessment with 'title' as title. Other attributes of the
         new Assessment are determined using this function accordingly to the
         set of assessments to merge.
+
+        Each assessment counts in the new one in proportion to its scale
+        multiplied by its coefficient in 'weights' (default to 1).
         """
         # Merge.
-        scales = [assessment.scale for assessment in assessments]
-        scale = sum(scales)
+        if weights is None:
+            weights = [1] * len(assessments)
+        scale = Source.merged_scale(assessments, weights)
 
         precision = min([assessment.precision for assessment in assessments])
 
-        results = [assessment.results for assessment in assessments]
-        results = Mark.merge(results)
+        students, scores, bonuses, totals = aggregate(
+            *_columns(assessments, weights))
+
+        # Marks are created at the scale of the new assessment, so that they
+        # are not rescaled one by one when added.
+        ratios = scale / numpy.maximum(totals, 1)
+        results = Mark.build(
+            students, scores * ratios, bonuses * ratios,
+            numpy.full(students.size, scale))
 
         # Create the new assessment.
         assessment = cls(title, scale, precision=precision)
         assessment.add_results(results)
+        assessment.sources = [Source(source, weight) for source, weight
+                              in zip(assessments, weights)]
         return assessment
 
     def rescale(self, scale: int) -> None:
@@ -352,6 +551,158 @@ class Assessment(BASE):
         """
         for mark in self.results:
             mark.rescale(scale)
+        self.summarize(reset=[mark.value for mark in self.results])
+
+    def summarize(self, added: Iterable[float] = (),
+                  removed: Iterable[float] = (),
+                  reset: Iterable[float] = None) -> None:
+        """
+        Update the summary of marks values.
+
+        Added values are inserted into the sorted values and removed ones are
+        taken out of them with binary searches, the values are never sorted
+        from scratch. Size, mean and extremes are updated from the changed
+        values only, the sum of squared deviations with Welford's updates
+        generalized to batches of values (Chan et al.), which do not suffer
+        from the cancellation of a raw sum of squares.
+
+        Removed values are matched to stored values up to the precision of
+        the assessment. If one of them is not found, the summary is out of
+        date: it is built again from the stored results.
+
+        - added:    Collection of floats. Values of new marks.
+        - removed:  Collection of floats. Values of removed marks, or previous
+                    values of modified marks.
+        - reset:    Collection of floats. If provided, the summary is built
+                    again from these values, 'added' and 'removed' are ignored.
+
+        Return: None.
+        """
+        if reset is not None:
+            values = numpy.sort(numpy.asarray(list(reset), dtype=float))
+            mean = float(values.mean()) if values.size else 0
+            self._values = values.tobytes()
+            self._size = int(values.size)
+            self._mean = mean
+            self._deviations = float(numpy.sum((values - mean) ** 2))
+            self._minimum = float(values[0]) if values.size else None
+            self._maximum = float(values[-1]) if values.size else None
+            self.touch()
+            return
+
+        added = numpy.asarray(list(added), dtype=float)
+        removed = numpy.asarray(list(removed), dtype=float)
+        if not added.size and not removed.size:
+            return
+
+        # Close removed values match successive stored values: each index is
+        # at least the previous one plus one.
+        values = self.values
+        tolerance = 0.5 * 10 ** -((self.precision or 0) + 3)
+        removed.sort()
+        offsets = numpy.arange(removed.size)
+        indices = numpy.maximum.accumulate(numpy.searchsorted(
+            values, removed - tolerance) - offsets) + offsets
+        found = indices < values.size
+        found[found] = numpy.abs(
+            values[indices[found]] - removed[found]) <= tolerance
+        if not found.all():
+            self.summarize(reset=self._stored_values())
+            return
+        values = numpy.delete(values, indices)
+        added.sort()
+        values = numpy.insert(values, numpy.searchsorted(values, added), added)
+
+        size, mean, deviations = self._size or 0, self._mean or 0, \
+            self._deviations or 0
+        for batch, sign in ((removed, -1), (added, 1)):
+            if not batch.size:
+                continue
+            count = sign * batch.size
+            total = size + count
+            if not total:
+                size, mean, deviations = 0, 0, 0
+                continue
+            delta = float(batch.mean()) - mean
+            batch_deviations = float(numpy.sum((batch - batch.mean()) ** 2))
+            deviations += sign * batch_deviations + \
+                delta ** 2 * size * count / total
+            mean += delta * count / total
+            size = total
+
+        self._values = values.tobytes()
+        self._size = int(values.size)
+        self._mean = mean if size else 0
+        self._deviations = max(deviations, 0) if size else 0
+        self._minimum = float(values[0]) if values.size else None
+        self._maximum = float(values[-1]) if values.size else None
+        self.touch()
+
+    def _stored_values(self) -> List[float]:
+        """Values of assessment's results, read from storage if stored."""
+        session = object_session(self)
+        if session is None or self.identifier is None:
+            return [mark.value for mark in self.results]
+        query = session.query(Mark.value)
+        query = query.filter(Mark.assessment_id == self.identifier)
+        return [value for value, in query]
+
+    def touch(self) -> None:
+        """Increment the version of the assessment."""
+        self.version = (self.version or 0) + 1
+
+    @property
+    def values(self):
+        """Sorted array of marks values."""
+        if not self._values:
+            return numpy.empty(0, dtype=float)
+        return numpy.frombuffer(self._values, dtype=float)
+
+    @property
+    def size(self) -> int:
+        """Number of results."""
+        return self._size or 0
+
+    @property
+    def minimum(self) -> float:
+        """Lowest mark value."""
+        return self._minimum
+
+    @property
+    def maximum(self) -> float:
+        """Highest mark value."""
+        return self._maximum
+
+    @property
+    def mean(self) -> float:
+        """Arithmetic mean of marks values."""
+        if not self.size:
+            return None
+        return self._mean
+
+    @property
+    def deviation(self) -> float:
+        """Population standard deviation of marks values."""
+        if not self.size:
+            return None
+        return sqrt(self._deviations / self.size)
+
+    def percentile(self, rank: float) -> float:
+        """
+        Compute a percentile of marks values.
+
+        - rank: Float. Percentile to compute, between 0 and 100.
+
+        Return: A float, or None if the assessment has no results.
+        """
+        if not self.size:
+            return None
+        return float(numpy.percentile(self.values, rank))
+
+    @property
+    def median(self) -> float:
+        """Median of marks values."""
+        return self.percentile(50)
 
     def get_results(self, group=None):
         """
@@ -364,3 +715,60 @@ class Assessment(BASE):
             res = filter(lambda m: m.student.identity in group, self.results)
             return list(res)
         return self.results
+
+
+class Source(BASE):
+    """
+    Source of a merged assessment.
+
+    Merged assessments keep track of the assessments they are computed from,
+    and of the version of each source when they were last computed, so that
+    they can be computed again when a source is modified.
+
+    - merged:   <Assessment> object. The merged assessment.
+    - source:   <Assessment> object. One of the merged assessments.
+    - weight:   Float. Coefficient of the source in the merged assessment.
+    - seen:     Integer. Version of the source when the merged assessment was
+                last computed.
+    """
+
+    __tablename__ = 'assessments_sources'
+
+    merged_id = Column(
+        Integer, ForeignKey('assessments.identifier'), primary_key=True)
+    source_id = Column(
+        Integer, ForeignKey('assessments.identifier'), primary_key=True)
+    weight = Column(Float, nullable=False, default=1, server_default='1')
+    seen = Column(Integer)
+
+    merged = relationship(
+        'Assessment', foreign_keys=[merged_id], back_populates='sources')
+    source = relationship(
+        'Assessment', foreign_keys=[source_id], back_populates='derivations')
+
+    def __init__(self, source: Assessment, weight: float = 1) -> None:
+        super().__init__()
+        self.source = source
+        self.weight = weight
+        self.seen = source.version
+
+    def __repr__(self) -> str:
+        return '<Source #{} of #{}>'.format(self.source_id, self.merged_id)
+
+    @staticmethod
+    def merged_scale(assessments, weights) -> int:
+        """
+        Scale of an assessment merged from weighted assessments.
+
+        - assessments:  Collection of <Assessment> objects. The sources.
+        - weights:      Collection of floats. Coefficient of each source.
+
+        Return: An integer, the sum of sources' scales times their weights.
+        """
+        return int(round(sum(assessment.scale * weight for assessment, weight
+                             in zip(assessments, weights))))
+
+    @property
+    def stale(self) -> bool:
+        """True if the source changed since the merged assessment was computed."""
+        return self.seen != self.source.version
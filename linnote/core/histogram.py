@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Draw histograms of marks as SVG documents.
+
+Marks are binned with NumPy and the SVG markup is written directly, without
+any plotting library. Rendered documents are kept in the in-process store of
+computed results, keyed by the ranking and the version of its data, so that
+values are only loaded to draw a new document.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+from math import floor, log10
+from typing import Callable, List
+from xml.sax.saxutils import escape
+import numpy
+from .utils.cache import COMPUTED
+
+
+WIDTH, HEIGHT = 432, 288
+MARGINS = {'top': 36, 'right': 16, 'bottom': 32, 'left': 44}
+MIN_BINS, MAX_BINS = 10, 40
+
+
+def bins(values, scale: int) -> int:
+    """
+    Choose the number of bins of an histogram.
+
+    One bin per point of the scale is used while it stays readable. For larger
+    scales, the number of bins is estimated from the data and bounded.
+
+    - values:   Sequence of floats. The values to bin.
+    - scale:    Integer. Maximal possible value.
+
+    Return: An integer.
+    """
+    if scale <= MAX_BINS:
+        return max(int(scale), 1)
+    values = numpy.asarray(values, dtype=float)
+    if values.size < 2:
+        return MIN_BINS
+    edges = numpy.histogram_bin_edges(values, bins='auto', range=(0, scale))
+    return min(max(edges.size - 1, MIN_BINS), MAX_BINS)
+
+
+def histogram(key: str, load: Callable, scale: int, title: str = '') -> str:
+    """
+    Draw an histogram, or fetch it from the cache.
+
+    - key:      String. Identifies the data, for example a ranking identifier
+                and a version of its data.
+    - load:     Function. Returns the sequence of floats to draw, only called
+                when the histogram is not cached.
+    - scale:    Integer. Maximal possible value.
+    - title:    String. Title of the histogram.
+
+    Return: A string, the SVG document.
+    """
+    key = '{}:{}:{}'.format(key, scale, title)
+    document = COMPUTED.get('histogram', key)
+    if document is None:
+        document = render(load(), scale, title)
+        COMPUTED.set('histogram', key, document)
+    return document
+
+
+def render(values, scale: int, title: str = '') -> str:
+    """
+    Draw an histogram.
+
+    - values:   Sequence of floats. The values to draw.
+    - scale:    Integer. Maximal possible value.
+    - title:    String. Title of the histogram.
+
+    Return: A string, the SVG document.
+    """
+    values = numpy.asarray(values, dtype=float)
+    counts, edges = numpy.histogram(
+        values, bins=bins(values, scale), range=(0, max(scale, 1)))
+
+    left, top = MARGINS['left'], MARGINS['top']
+    width = WIDTH - MARGINS['left'] - MARGINS['right']
+    height = HEIGHT - MARGINS['top'] - MARGINS['bottom']
+    bottom = top + height
+
+    xticks = _ticks(edges[-1])
+    yticks = _ticks(max(counts.max(initial=0), 1))
+    xscale = width / edges[-1]
+    yscale = height / yticks[-1]
+
+    # Bars, drawn as a single step-filled path.
+    path = ['M{:.2f},{:.2f}'.format(left, bottom)]
+    for count, start, end in zip(counts.tolist(), edges[:-1], edges[1:]):
+        y = bottom - count * yscale
+        path.append('L{:.2f},{:.2f}'.format(left + start * xscale, y))
+        path.append('L{:.2f},{:.2f}'.format(left + end * xscale, y))
+    path.append('L{:.2f},{:.2f}Z'.format(left + width, bottom))
+
+    elements = [
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {} {}" '
+        'font-family="sans-serif" font-size="10">'.format(WIDTH, HEIGHT),
+        '<text x="{}" y="{}" text-anchor="middle" font-size="12">{}</text>'
+        .format(WIDTH / 2, top / 2, escape(title)),
+        '<path d="{}" fill="#CCCCCC" stroke="#888888"/>'.format(''.join(path)),
+        '<path d="M{0},{1}V{2}H{3}" fill="none" stroke="black"/>'
+        .format(left, top, bottom, left + width)]
+
+    for tick in xticks:
+        x = left + tick * xscale
+        elements.append(
+            '<line x1="{0:.2f}" y1="{1}" x2="{0:.2f}" y2="{2}" stroke="black"/>'
+            '<text x="{0:.2f}" y="{3}" text-anchor="middle">{4}</text>'
+            .format(x, bottom, bottom + 4, bottom + 16, _label(tick)))
+    for tick in yticks:
+        y = bottom - tick * yscale
+        elements.append(
+            '<line x1="{1}" y1="{0:.2f}" x2="{2}" y2="{0:.2f}" stroke="black"/>'
+            '<text x="{3}" y="{0:.2f}" text-anchor="end" dy="0.3em">{4}</text>'
+            .format(y, left - 4, left, left - 6, _label(tick)))
+
+    elements.append('</svg>')
+    return '\n'.join(elements)
+
+
+def _ticks(maximum: float, count: int = 8) -> List[float]:
+    """Round values from zero to at least 'maximum', at most 'count' + 1."""
+    raw = maximum / count
+    magnitude = 10 ** floor(log10(raw))
+    step = next(
+        factor * magnitude for factor in (1, 2, 5, 10)
+        if factor * magnitude >= raw)
+    number = int(numpy.ceil(maximum / step - 1e-9))
+    return [index * step for index in range(number + 1)]
+
+
+def _label(value: float) -> str:
+    """Format a tick label."""
+    return '{:g}'.format(round(value, 6))
@@ -8,28 +8,15 @@ Author: Anatole Hanniet, 2016-2018.
 License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
-from functools import wraps
-from itertools import groupby, repeat
-from operator import attrgetter
-from sqlalchemy import Column
+from bisect import bisect_right
+import numpy
+from sqlalchemy import Column, Index
 from sqlalchemy import Integer, ForeignKey
 from sqlalchemy.orm import relationship
 from .utils import BASE
 
 
-def ranker(function):
-    """Decorator for tie handling methods."""
-    @wraps(function)
-    def wrapper(position, group):
-        """Wrapping function."""
-        size = sum(1 for _ in group)
-        rank, offset = function(position, size)
-        return repeat(rank, size), offset
-    return wrapper
-
-
-@ranker
-def high(position, size):
+def high(first, _size, _dense):
     """
     Tie handling function.
 
@@ -38,14 +25,16 @@ def high(position, size):
     rank, the next available ranks is equal to the sum of the actual rank plus
     the number of tied values.
 
-    Return: A tuple. First item is the rank for tied values ; second item is
-            the offset to the next rank.
+    - first:    Array. Position of the first item of each item's tie group.
+    - size:     Array. Size of each item's tie group.
+    - dense:    Array. Position of each item's tie group among tie groups.
+
+    Return: An array of positions.
     """
-    return position, size
+    return first
 
 
-@ranker
-def low(position, size):
+def low(first, size, _dense):
     """
     Tie handling function.
 
@@ -54,31 +43,26 @@ def low(position, size):
     the sum of the actual rank plus the number of tied values, tied values are
     assigned this next rank minus one.
 
-    Return: A tuple. First item is the rank for tied values ; second item is
-            the offset to the next rank.
+    Return: An array of positions.
     """
-    return position + size - 1, size
+    return first + size - 1
 
 
-# Consider using decimal instead.
-@ranker
-def average(position, size):
+def average(first, size, _dense):
     """
     Tie handling function.
 
     Handle tie ranking using the 'Standard Competition' strategy defined here:
     https://en.wikipedia.org/wiki/Ranking. The next available ranks is equal to
     the sum of the actual rank plus the number of tied values, tied values are
-    assigned the arithmetic mean of the curent rank and the next rank.
+    assigned the arithmetic mean of the ranks they span.
 
-    Return: A tuple. First item is the rank for tied values ; second item is
-            the offset to the next rank.
+    Return: An array of positions.
     """
-    return position * (1 + size) / 2, size
+    return first + (size - 1) / 2
 
 
-@ranker
-def sequential(position, _size):
+def sequential(_first, _size, dense):
     """
     Tie handling function.
 
@@ -86,10 +70,97 @@ def sequential(position, _size):
     https://en.wikipedia.org/wiki/Ranking. Tied values are assigned the current
     rank, the next available rank is equal to the next integer.
 
-    Return: A tuple. First item is the rank for tied values ; second item is
-            the offset to the next rank.
+    Return: An array of positions.
+    """
+    return dense
+
+
+def positions(scores, handle=high, start=1, precision=None):
+    """
+    Compute positions of already sorted scores.
+
+    Scores are tied when they are equal once rounded to 'precision' decimals.
+
+    - scores:       Sequence of floats. Scores, sorted in ranking order.
+    - handle:       Function. Tie handling function.
+    - start:        Integer. Position of the first item.
+    - precision:    Integer. Number of decimals considered for ties. If None,
+                    only strictly equal scores are tied.
+
+    Return: An array of positions, in the same order than 'scores'.
+    """
+    scores = numpy.asarray(scores, dtype=float)
+    if precision is not None:
+        scores = numpy.round(scores, precision)
+    if not scores.size:
+        return numpy.empty(0, dtype=int)
+
+    # Find where each tie group begins and its size.
+    breaks = numpy.flatnonzero(scores[1:] != scores[:-1]) + 1
+    firsts = numpy.concatenate(([0], breaks))
+    sizes = numpy.diff(numpy.append(firsts, scores.size))
+    groups = numpy.repeat(numpy.arange(firsts.size), sizes)
+
+    return handle(firsts[groups] + start, sizes[groups], groups + start)
+
+
+def rank(scores, handle=high, start=1, precision=None, reverse=True):
+    """
+    Rank scores.
+
+    - scores:       Sequence of floats. Scores to rank.
+    - handle:       Function. Tie handling function.
+    - start:        Integer. Position of the first item.
+    - precision:    Integer. Number of decimals considered for ties.
+    - reverse:      Boolean. If True, the highest score comes first.
+
+    Return: A tuple. First item is the array of indices sorting 'scores' ;
+            second item is the array of positions of the sorted scores.
+    """
+    scores = numpy.asarray(scores, dtype=float)
+    if precision is not None:
+        scores = numpy.round(scores, precision)
+    keys = -scores if reverse else scores
+    order = numpy.argsort(keys, kind='mergesort')
+    return order, positions(scores[order], handle, start)
+
+
+def update(ranked, changes, handle=high, start=1, precision=None,
+           reverse=True):
     """
-    return position, 1
+    Update an existing ranking with new or modified scores.
+
+    Changed items are removed from the ranking, then every new score is
+    inserted into the existing order with a binary search. Only positions are
+    computed again, the ranking is never sorted from scratch.
+
+    - ranked:       Sequence of (identifier, score) tuples, in ranking order.
+    - changes:      Dictionary mapping identifiers to their new score. Unknown
+                    identifiers are inserted, known ones are moved.
+    - handle:       Function. Tie handling function.
+    - start:        Integer. Position of the first item.
+    - precision:    Integer. Number of decimals considered for ties.
+    - reverse:      Boolean. If True, the highest score comes first.
+
+    Return: A tuple. First item is the list of identifiers in ranking order ;
+            second item is the array of their positions.
+    """
+    def key(score):
+        """Sort key of a score."""
+        if precision is not None:
+            score = round(score, precision)
+        return -score if reverse else score
+
+    ranked = [(item, score) for item, score in ranked if item not in changes]
+    identifiers = [item for item, _ in ranked]
+    keys = [key(score) for _, score in ranked]
+
+    for item, score in changes.items():
+        index = bisect_right(keys, key(score))
+        keys.insert(index, key(score))
+        identifiers.insert(index, item)
+
+    return identifiers, positions(keys, handle, start)
 
 
 class Ranking(BASE):
@@ -103,20 +174,49 @@ class Ranking(BASE):
 
     assessment = relationship('Assessment', back_populates='rankings')
     group = relationship('Group')
-    ranks = relationship('Rank', back_populates='ranking', cascade='all')
+    ranks = relationship('Rank', back_populates='ranking', cascade='all',
+                         order_by='(Rank.position, Rank.identifier)')
 
     def __init__(self, assessment, group=None, **kwargs) -> None:
+        """
+        Create a new ranking.
+
+        - assessment:   <Assessment> object. The ranked assessment.
+        - group:        <Group> object. If provided, only results of group's
+                        members are ranked.
+        * start:        Integer. Position of the first rank.
+        * handle:       Function. Tie handling function.
+        * reverse:      Boolean. If True, the highest score comes first.
+        * ordered:      List of <Mark> objects. Results already sorted in
+                        ranking order, used instead of assessment's results.
+
+        The ranking is not attached to the assessment: positions are kept in
+        'results' and 'positions' until the ranking is saved, so that ranks
+        can be written in bulk instead of through the unit of work.
+
+        Return: None.
+        """
         super().__init__()
-        self.assessment = assessment
+        self._assessment = assessment
         self.group = group
-        self.ranks = [Rank(self, result) for result in assessment.get_results(group)]
         self.start = kwargs.get('start', 1)
         self.handle = kwargs.get('handle', high)
 
         # Establish ranking.
-        self.ranks.sort(key=attrgetter('mark.score'), reverse=kwargs.get('reverse', True))
-        for rank, item in self.rank():
-            item.position = rank
+        results = kwargs.get('ordered')
+        if results is None:
+            results = assessment.get_results(group)
+            order, ranks = rank(
+                [result.score for result in results], self.handle,
+                start=self.start, precision=assessment.precision,
+                reverse=kwargs.get('reverse', True))
+            results = [results[index] for index in order.tolist()]
+        else:
+            ranks = positions(
+                [result.score for result in results], self.handle,
+                start=self.start, precision=assessment.precision)
+        self.results = results
+        self.positions = ranks.tolist()
 
     def __repr__(self):
         return '<Ranking>'
@@ -124,14 +224,22 @@ class Ranking(BASE):
     def __iter__(self):
         return iter(self.ranks)
 
-    def rank(self):
-        """Calculate ranks."""
-        index = self.start
-        for _, group in groupby(self.ranks, attrgetter('mark.score')):
-            group = list(group)
-            ranks, offset = self.handle(index, group)
-            index += offset
-            yield from zip(ranks, group)
+    def subset(self, group, members) -> 'Ranking':
+        """
+        Derive the ranking of a group from this ranking.
+
+        Results of group's members are picked in the order of this ranking,
+        so only positions have to be computed again.
+
+        - group:    <Group> object. The group to rank.
+        - members:  Set of integers. Identifiers of group's students.
+
+        Return: A <Ranking> object.
+        """
+        results = [mark for mark in self.results
+                   if mark.student_id in members]
+        return Ranking(self._assessment, group, start=self.start,
+                       handle=self.handle, ordered=results)
 
 
 class Rank(BASE):
@@ -139,6 +247,9 @@ class Rank(BASE):
 
     # Model definition.
     __tablename__ = 'ranks'
+    __table_args__ = (
+        Index('ix_ranks_ranking_position', 'ranking_id', 'position'),
+        Index('ix_ranks_ranking_mark', 'ranking_id', 'mark_id'))
     identifier = Column(Integer(), primary_key=True)
     ranking_id = Column(Integer(), ForeignKey('rankings.identifier'))
     mark_id = Column(Integer(), ForeignKey('marks.identifier'))
@@ -0,0 +1,20 @@
+function fillStatistics(table) {
+    let req = new XMLHttpRequest();
+    req.responseType = "json";
+    req.onreadystatechange = function() {
+        if(req.readyState === 4 && req.status === 200) {
+            let cells = table.querySelectorAll("[data-field]");
+            for (var index = 0; index < cells.length; index++) {
+                let cell = cells[index];
+                cell.textContent = req.response[cell.getAttribute("data-field")];
+            };
+        };
+    };
+    req.open("GET", table.getAttribute("data-source"), true);
+    req.send();
+}
+
+var statisticsTables = document.querySelectorAll("table.statistics[data-source]");
+for (var index = 0; index < statisticsTables.length; index++) {
+    fillStatistics(statisticsTables[index]);
+};
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Descriptive statistics of rankings.
+
+Statistics (size, minimum, quartiles, maximum, mean and standard deviation)
+are computed in one vectorized pass over the values of the requested rankings
+missing from the cache. They are cached as long as the version of the ranked
+data does not change, so that requests for an unmodified ranking do not read
+its values.
+
+Sorted values of rankings are cached too, for percentile lookups. Cached data
+is kept in the in-process store of computed results, shared with histograms.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+from typing import Dict, List
+import numpy
+from .assessment import Mark
+from .ranking import Rank
+from .utils.cache import COMPUTED
+
+
+def describe(session, rankings: List[int], version, precision: int = None
+             ) -> Dict[int, Dict[str, float]]:
+    """
+    Compute descriptive statistics of rankings, or fetch them from the cache.
+
+    - session:      Database session.
+    - rankings:     List of integers. Identifiers of the rankings.
+    - version:      Hashable. Version of rankings' data, for example the
+                    version of the assessment.
+    - precision:    Integer. If provided, statistics are rounded to this
+                    number of decimals.
+
+    Return: A dictionary mapping rankings identifier to their statistics:
+            'size', 'minimum', 'first_quartile', 'median', 'third_quartile',
+            'maximum', 'mean' and 'deviation'. Statistics of an empty ranking
+            are zeros.
+    """
+    cached = {ranking: COMPUTED.get('statistics', _key(ranking, version))
+              for ranking in rankings}
+    missing = [ranking for ranking, item in cached.items() if item is None]
+    if missing:
+        for ranking, statistics in compute(session, missing).items():
+            COMPUTED.set('statistics', _key(ranking, version), statistics)
+            cached[ranking] = statistics
+
+    statistics = {ranking: dict(cached[ranking]) for ranking in rankings}
+    if precision is not None:
+        for values in statistics.values():
+            for name, value in values.items():
+                if name != 'size':
+                    values[name] = round(value, precision)
+    return statistics
+
+
+def compute(session, rankings: List[int]) -> Dict[int, Dict[str, float]]:
+    """
+    Compute descriptive statistics of rankings in one pass over their values.
+
+    - session:      Database session.
+    - rankings:     List of integers. Identifiers of the rankings.
+
+    Return: A dictionary mapping rankings identifier to their statistics, see
+            'describe'.
+    """
+    query = session.query(Rank.ranking_id, Mark.value)
+    query = query.join(Mark, Rank.mark_id == Mark.identifier)
+    query = query.filter(Rank.ranking_id.in_(rankings))
+    rows = numpy.array(query.all(), dtype=float).reshape(-1, 2)
+
+    # Sort by ranking then value, and split values by ranking.
+    rows = rows[numpy.lexsort((rows[:, 1], rows[:, 0]))]
+    identifiers, starts = numpy.unique(rows[:, 0], return_index=True)
+    groups = numpy.split(rows[:, 1], starts[1:])
+
+    statistics = {ranking: dict.fromkeys(
+        ('size', 'minimum', 'first_quartile', 'median', 'third_quartile',
+         'maximum', 'mean', 'deviation'), 0) for ranking in rankings}
+    for ranking, values in zip(identifiers.astype(int).tolist(), groups):
+        first, median, third = numpy.percentile(values, [25, 50, 75]).tolist()
+        statistics[ranking] = {
+            'size': int(values.size), 'minimum': float(values[0]),
+            'first_quartile': first, 'median': median,
+            'third_quartile': third, 'maximum': float(values[-1]),
+            'mean': float(values.mean()), 'deviation': float(values.std())}
+    return statistics
+
+
+def sorted_values(session, ranking: int, version: int) -> numpy.ndarray:
+    """
+    Sorted values of a ranking, or fetch them from the cache.
+
+    - session:  Database session.
+    - ranking:  Integer. Identifier of the ranking.
+    - version:  Hashable. Version of ranking's data, for example the version
+                of the assessment.
+
+    Return: A sorted array of floats.
+    """
+    array = COMPUTED.get('values', _key(ranking, version))
+    if array is not None:
+        return array
+
+    query = session.query(Mark.value)
+    query = query.join(Rank, Rank.mark_id == Mark.identifier)
+    query = query.filter(Rank.ranking_id == ranking)
+    array = numpy.sort(numpy.array([value for value, in query], dtype=float))
+    COMPUTED.set('values', _key(ranking, version), array)
+    return array
+
+
+def percentile(values, value: float) -> float:
+    """
+    Percentile rank of a value among sorted values.
+
+    Values below count fully, values equal to 'value' count for half.
+
+    - values:   Sorted sequence of floats.
+    - value:    Float.
+
+    Return: A float between 0 and 100, or None if 'values' is empty.
+    """
+    if not len(values):
+        return None
+    below = int(numpy.searchsorted(values, value, side='left'))
+    equal = int(numpy.searchsorted(values, value, side='right')) - below
+    return 100 * (below + equal / 2) / len(values)
+
+
+def _key(ranking: int, version) -> str:
+    """Key of ranking's data in the cache."""
+    return '{}:{}'.format(ranking, version)
@@ -20,7 +20,12 @@ from .utils.jwt import encode
 
 
 class User(BASE):
-    """Someone that use the application."""
+    """
+    Someone that use the application.
+
+    The 'version' attribute is incremented each time user's details are
+    modified.
+    """
 
     # Model definition.
     __tablename__ = 'users'
@@ -30,6 +35,7 @@ class User(BASE):
     email = Column(String(250), nullable=False, unique=True, index=True)
     password_hash = Column(Text())
     is_verified = Column(Boolean(), default=False)
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
 
     profile = relationship(
         'Profile', back_populates='identity', uselist=False, cascade='all')
@@ -60,6 +66,10 @@ class User(BASE):
         """User's fullname (concatenation of first and last names)."""
         return f'{self.firstname} {self.lastname}'
 
+    def touch(self) -> None:
+        """Increment the version of the user."""
+        self.version = (self.version or 0) + 1
+
     def get_id(self) -> str:
         """
         Return the user identifier as a string for login.
@@ -139,8 +149,9 @@ class Student(Profile):
     __mapper_args__ = {'polymorphic_identity': 'student'}
     identifier = Column(Integer(),
                         ForeignKey('profiles.identifier'), primary_key=True)
-    aid = Column(Integer())
-    results = relationship('Mark', back_populates='student')
+    aid = Column(Integer(), index=True)
+    results = relationship(
+        'Mark', back_populates='student', cascade_backrefs=False)
 
     def __repr__(self) -> str:
         return f'<Student {self.identifier}>'
@@ -164,12 +175,15 @@ class Group(BASE):
     The 'members' attribute that stores the collection of group's users is a
     'list' to ensure compatibility with SQLAlchemy. But Group methods will
     behave like if it is a set to ensure that no duplicate is present.
+
+    The 'version' attribute is incremented each time members are modified.
     """
 
     # SQLAlchemy model definition.
     __tablename__ = 'groups'
     identifier = Column(Integer(), primary_key=True)
     name = Column(String(250), nullable=False, unique=True, index=True)
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
     members = relationship(
         'User', secondary='users_groups', back_populates='groups')
 
@@ -203,6 +217,7 @@ class Group(BASE):
         """
         if not user in set(self.members):
             self.members.append(user)
+            self.touch()
 
     def extend(self, users: List[User]):
         """
@@ -214,10 +229,16 @@ class Group(BASE):
         actual_members = set(self.members)
         candidates = set(users)
         self.members.extend(candidates - actual_members)
+        self.touch()
 
     def remove(self, user: User):
         """Remove a user from group's members."""
         self.members.remove(user)
+        self.touch()
+
+    def touch(self) -> None:
+        """Increment the version of the group."""
+        self.version = (self.version or 0) + 1
 
     def pop(self, user: User) -> User:
         """
@@ -225,6 +246,7 @@ class Group(BASE):
 
         The removed user is then returned.
         """
+        self.touch()
         return self.members.pop(user)
 
     def clear(self):
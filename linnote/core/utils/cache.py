@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache of rendered template fragments.
+
+Fragments are first looked up in an in-process LRU store bounded in memory,
+then in an optional shared store, so that every worker of the application
+benefits from fragments rendered by the others. Two shared stores are
+available: a filesystem directory and a memcached server.
+
+Keys hold the version of the cached data, so a modified object is never served
+from the cache. Obsolete fragments of a namespace can also be dropped with
+'invalidate' to free memory.
+
+The same in-process store also keeps results computed from ranked data, such
+as statistics and histograms, see 'COMPUTED'. Any value may be stored there:
+its size is estimated with 'getsizeof'.
+
+The cache is configured from the [FLASK] section of the configuration file:
+- FRAGMENT_CACHE_SIZE:      Integer. Memory bound of the in-process store, in
+                            bytes. Default to 32 MiB, 0 disables the cache.
+- FRAGMENT_CACHE_BACKEND:   URL of the shared store, either
+                            'file:///path/to/directory' or
+                            'memcached://host:port'. Optional.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+from collections import Counter, OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from shutil import rmtree
+from sys import getsizeof
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+from markupsafe import Markup
+
+
+SIZE = 32 * 2 ** 20
+
+
+class MemoryStore:
+    """
+    In-process LRU store, bounded by the memory used by its values.
+
+    The store is shared by threads of the process: accesses are locked.
+    """
+
+    def __init__(self, limit: int = SIZE) -> None:
+        self.limit = limit
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Fetch a value, or None if it is not stored."""
+        with self._lock:
+            value = self._items.get((namespace, key))
+            if value is not None:
+                self._items.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used ones."""
+        size = getsizeof(value)
+        if size > self.limit:
+            return
+        with self._lock:
+            previous = self._items.pop((namespace, key), None)
+            if previous is not None:
+                self.size -= getsizeof(previous)
+            self._items[(namespace, key)] = value
+            self.size += size
+            while self.size > self.limit:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= getsizeof(evicted)
+
+    def invalidate(self, namespace: str) -> None:
+        """Remove every value of a namespace."""
+        with self._lock:
+            for item in [item for item in self._items if item[0] == namespace]:
+                self.size -= getsizeof(self._items.pop(item))
+
+
+class FileSystemStore:
+    """Shared store keeping values as files of a directory."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, namespace: str, key: str) -> Path:
+        return self.directory / _digest(namespace) / _digest(key)
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Fetch a value, or None if it is not stored."""
+        try:
+            return self._path(namespace, key).read_text(encoding='utf-8')
+        except OSError:
+            return None
+
+    def set(self, namespace: str, key: str, value: str) -> None:
+        """Store a value. The file is replaced atomically."""
+        path = self._path(namespace, key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with NamedTemporaryFile('w', encoding='utf-8', dir=path.parent,
+                                    delete=False) as file:
+                file.write(value)
+            Path(file.name).replace(path)
+        except OSError:
+            pass
+
+    def invalidate(self, namespace: str) -> None:
+        """Remove every value of a namespace."""
+        rmtree(self.directory / _digest(namespace), ignore_errors=True)
+
+
+class MemcachedStore:
+    """
+    Shared store on a memcached server.
+
+    Requires the 'pymemcache' package. Values are never removed explicitly:
+    their key holds a version, obsolete values are evicted by the server.
+    """
+
+    def __init__(self, host: str, port: int = 11211) -> None:
+        from pymemcache.client.base import Client
+        self.client = Client((host, port), connect_timeout=1, timeout=1,
+                             ignore_exc=True)
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Fetch a value, or None if it is not stored."""
+        value = self.client.get(_digest(namespace, key))
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, namespace: str, key: str, value: str) -> None:
+        """Store a value."""
+        self.client.set(_digest(namespace, key), value.encode('utf-8'))
+
+    def invalidate(self, namespace: str) -> None:
+        """Obsolete values are left to the server eviction."""
+
+
+class FragmentCache:
+    """
+    Two-level cache of rendered fragments.
+
+    Hits and misses are counted for each level, see 'statistics'.
+    """
+
+    def __init__(self, limit: int = SIZE, shared=None) -> None:
+        self.local = MemoryStore(limit) if limit else None
+        self.shared = shared
+        self.counters = Counter()
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Fetch a fragment from the first level that holds it."""
+        if self.local is not None:
+            value = self.local.get(namespace, key)
+            if value is not None:
+                self.counters['local_hits'] += 1
+                return value
+            self.counters['local_misses'] += 1
+
+        if self.shared is not None:
+            value = self.shared.get(namespace, key)
+            if value is not None:
+                self.counters['shared_hits'] += 1
+                if self.local is not None:
+                    self.local.set(namespace, key, value)
+                return value
+            self.counters['shared_misses'] += 1
+        return None
+
+    def set(self, namespace: str, key: str, value: str) -> None:
+        """Store a fragment in every level."""
+        for store in (self.local, self.shared):
+            if store is not None:
+                store.set(namespace, key, value)
+
+    def invalidate(self, namespace: str) -> None:
+        """Remove every fragment of a namespace."""
+        self.counters['invalidations'] += 1
+        for store in (self.local, self.shared):
+            if store is not None:
+                store.invalidate(namespace)
+
+    def fragment(self, namespace: str, *key, caller=None) -> Markup:
+        """
+        Render a fragment, or fetch it from the cache.
+
+        Intended to be used from templates with a 'call' block:
+        {% call fragment('assessment-1', assessment.version) %}...{% endcall %}
+
+        - namespace:    String. Group of fragments invalidated together.
+        - key:          Fragment identification, including data version.
+        - caller:       Function. Renders the fragment.
+
+        Return: A <Markup> object.
+        """
+        if self.local is None and self.shared is None:
+            return Markup(caller())
+
+        key = ':'.join(str(part) for part in key)
+        value = self.get(namespace, key)
+        if value is None:
+            value = str(caller())
+            self.set(namespace, key, value)
+        return Markup(value)
+
+    def statistics(self) -> Dict[str, float]:
+        """
+        Hit rates of the cache, since the process started.
+
+        Return: A dictionary with counters, hit rates of each level and the
+                memory used by the in-process store.
+        """
+        statistics = dict(self.counters)
+        for level in ('local', 'shared'):
+            hits = self.counters[level + '_hits']
+            total = hits + self.counters[level + '_misses']
+            statistics[level + '_hit_rate'] = hits / total if total else None
+        statistics['local_size'] = self.local.size if self.local else 0
+        return statistics
+
+
+FRAGMENTS = FragmentCache()
+COMPUTED = MemoryStore(8 * 2 ** 20)
+
+
+def configure(app) -> None:
+    """
+    Configure the fragment cache and make it available to templates.
+
+    Return: None.
+    """
+    limit = int(app.config.get('FRAGMENT_CACHE_SIZE', SIZE))
+    FRAGMENTS.local = MemoryStore(limit) if limit else None
+    FRAGMENTS.shared = store(app.config.get('FRAGMENT_CACHE_BACKEND'))
+    app.add_template_global(FRAGMENTS.fragment, 'fragment')
+
+
+def store(url: str = None):
+    """
+    Build a shared store from its URL.
+
+    Return: A store, or None if no URL is provided.
+    """
+    if not url:
+        return None
+    url = urlparse(url)
+    if url.scheme == 'file':
+        return FileSystemStore(url.path)
+    if url.scheme == 'memcached':
+        return MemcachedStore(url.hostname, url.port or 11211)
+    raise ValueError('unknown fragment cache backend: {}'.format(url.scheme))
+
+
+def _digest(*parts: str) -> str:
+    """Fixed length, file and memcached safe, key."""
+    return sha1(':'.join(parts).encode('utf-8')).hexdigest()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP related tools.
+
+Define a 'conditional' decorator that answers conditional GET requests of a
+view with a '304 Not Modified' response, before the view loads any data.
+Define a 'stream_template' function that sends a rendered template by parts.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+from functools import wraps
+from hashlib import sha1
+from time import time
+from typing import Callable, Iterable
+from flask import Response, current_app, make_response, request
+from flask import stream_with_context
+from flask_login import current_user
+
+
+def conditional(version: Callable[..., str], forms: bool = False) -> Callable:
+    """
+    Make a view answer conditional GET requests.
+
+    The ETag of the view is computed from a version of the displayed data and
+    from the current user, so that pages rendered for a user are never served
+    to another one. Other methods than GET and HEAD are not affected.
+
+    - version:  Function. Called with view's arguments, return a string that
+                changes whenever the displayed data change, or None if the
+                response should not be validated.
+    - forms:    Boolean. If True, the view embeds forms protected by expiring
+                CSRF tokens: the ETag also changes every half of the tokens
+                lifetime, so a cached page never holds an expired token.
+
+    Return: A decorator.
+    """
+    def decorator(view):
+        """Wrap the view."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            """Answer with 304 if the version of the page is unchanged."""
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            tag = version(**kwargs)
+            if tag is None:
+                return view(*args, **kwargs)
+            tag = [request.full_path, str(current_user.get_id()), tag]
+            lifetime = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+            if forms and lifetime:
+                tag.append(str(int(time() // (lifetime / 2))))
+            tag = sha1(':'.join(tag).encode()).hexdigest()
+
+            if request.if_none_match.contains(tag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def stream_template(name: str, flush: Iterable[str] = ('</section>',),
+                    **context) -> Response:
+    """
+    Render a template as a stream.
+
+    The page is sent while it is rendered: rendered parts are buffered and
+    flushed each time a part holds one of the 'flush' markers. The request
+    context, and so the database session, is kept until the end of the
+    stream.
+
+    - name:     String. Name of the template.
+    - flush:    Collection of strings. Markup after which the buffer is sent.
+    - context:  Variables of the template.
+
+    Return: A <flask.Response> object.
+    """
+    app = current_app._get_current_object()  # pylint: disable=W0212
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(name)
+    flush = tuple(flush)
+
+    def generate():
+        """Render the template and yield buffered parts."""
+        buffer = list()
+        for part in template.generate(context):
+            buffer.append(part)
+            if any(marker in part for marker in flush):
+                yield ''.join(buffer)
+                buffer = list()
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='text/html')
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Read tabular files by chunks.
+
+Records are read from the uploaded file a chunk at a time, so that memory use
+only depends on the chunk size and not on the size of the file. Supported
+formats are Excel workbooks (.xlsx, .xls) and delimited text (.csv, .tsv).
+The format is detected from the content of the file.
+
+Delimited text is parsed with the standard library only, pandas is imported
+solely for legacy Excel workbooks. Each chunk is converted column by column,
+and records are built once from the converted columns.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+import codecs
+import csv
+from itertools import islice, zip_longest
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+from openpyxl import load_workbook
+
+
+CHUNK_SIZE = 1000
+SAMPLE_SIZE = 4096
+BLOCK_SIZE = 65536
+DELIMITERS = ',;\t'
+
+# Leading bytes of Excel workbooks: zip archive (.xlsx) and OLE2 (.xls).
+XLSX_SIGNATURE = b'PK\x03\x04'
+XLS_SIGNATURE = b'\xd0\xcf\x11\xe0'
+
+
+def read(file, fields: List[str], converters: Dict[str, Callable] = None,
+         size: int = CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """
+    Read records of a tabular file by chunks.
+
+    The first row of the file is a header and is skipped. Columns are mapped
+    to 'fields' by position, further columns are ignored.
+
+    - file:         Path-like or file-like object. The file to read.
+    - fields:       List of strings. Names of the first columns.
+    - converters:   Dictionary mapping fields to conversion functions.
+    - size:         Integer. Maximal number of records per chunk.
+
+    Yield: Lists of records as dictionaries.
+    """
+    converters = converters if converters else dict()
+    converters = [converters.get(field) for field in fields]
+    width = len(fields)
+    empty = (None,) * width
+    rows = _rows(file)
+
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+
+        # Transpose the chunk, missing and empty cells are None.
+        columns = list(zip_longest(*chunk))[:width]
+        columns.extend([(None,) * len(chunk)] * (width - len(columns)))
+        columns = [_convert(column, convert)
+                   for column, convert in zip(columns, converters)]
+
+        records = [dict(zip(fields, values)) for values in zip(*columns)
+                   if values != empty]
+        if records:
+            yield records
+
+
+def _convert(column, convert: Callable = None) -> list:
+    """Convert the cells of a column, empty cells become None."""
+    if convert is None:
+        return [None if cell == '' else cell for cell in column]
+    return [None if cell is None or cell == '' else convert(cell)
+            for cell in column]
+
+
+def decimal(value) -> float:
+    """
+    Convert a cell to a float.
+
+    Text cells may use a comma as decimal separator. Surrounding whitespace is
+    ignored by 'float'.
+    """
+    if isinstance(value, str):
+        value = value.replace(',', '.')
+    return float(value)
+
+
+def _rows(file) -> Iterator[tuple]:
+    """
+    Iterate over the rows of a file, header excluded.
+
+    Rows are not normalized: they may be shorter or longer than the expected
+    fields, and hold empty strings or None for empty cells.
+    """
+    if not hasattr(file, 'read'):
+        with Path(file).open('rb') as stream:
+            yield from _rows(stream)
+        return
+
+    sample = file.read(SAMPLE_SIZE)
+    file.seek(0)
+
+    if sample.startswith(XLSX_SIGNATURE):
+        yield from _read_workbook(file)
+    elif sample.startswith(XLS_SIGNATURE):
+        yield from _read_legacy(file)
+    else:
+        yield from _read_delimited(file, sample)
+
+
+def _read_workbook(file) -> Iterator[tuple]:
+    """Stream rows of the first sheet of an Excel workbook."""
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        yield from sheet.iter_rows(min_row=2, values_only=True)
+    finally:
+        workbook.close()
+
+
+def _read_delimited(file, sample: bytes) -> Iterator[list]:
+    """
+    Stream rows of a delimited text file.
+
+    Encoding (UTF-8 or Windows-1252) and delimiter (comma, semicolon or tab)
+    are detected from the beginning of the file.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        text = decoder.decode(sample, final=False)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        text = sample.decode('cp1252', errors='replace')
+        encoding = 'cp1252'
+
+    # The header is the most reliable line to find the delimiter, as scores
+    # may use a comma as decimal separator.
+    header = text.splitlines()[0] if text else ''
+    delimiter = max(DELIMITERS, key=header.count)
+
+    rows = csv.reader(_lines(file, encoding), delimiter=delimiter)
+    next(rows, None)
+    return rows
+
+
+def _lines(file, encoding: str) -> Iterator[str]:
+    """Decode a binary file by blocks and iterate over its lines."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    remainder = ''
+    while True:
+        block = file.read(BLOCK_SIZE)
+        text = remainder + decoder.decode(block, final=not block)
+        lines = text.splitlines(keepends=True)
+        remainder = lines.pop() if lines and block else ''
+        yield from lines
+        if not block:
+            return
+
+
+def _read_legacy(file) -> Iterator[tuple]:
+    """Read rows of a legacy Excel workbook, which cannot be streamed."""
+    # Imported here so that pandas is only loaded when really needed.
+    from pandas import read_excel
+
+    frame = read_excel(file, header=0)
+    frame = frame.astype(object).where(frame.notnull(), None)
+    return frame.itertuples(index=False, name=None)
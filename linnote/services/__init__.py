@@ -8,12 +8,18 @@ Author: Anatole Hanniet, 2016-2018.
 License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
-from flask import Blueprint, jsonify, url_for
+from flask import Blueprint, abort, jsonify, request, url_for
 from flask.views import MethodView
-from flask_login import login_required
-from linnote.core.assessment import Assessment
-from linnote.core.user import User, Group
+from flask_login import current_user, login_required
+from sqlalchemy import and_, or_
+from linnote.assessments.logic import assessment_version, synchronize
+from linnote.core.assessment import Assessment, Mark
+from linnote.core.ranking import Ranking, Rank
+from linnote.core.user import User, Group, Student
 from linnote.core.utils import DATA
+from linnote.core.utils.cache import FRAGMENTS
+from linnote.core.utils.http import conditional
+from linnote.core.statistics import percentile, sorted_values
 
 
 BLUEPRINT = Blueprint('api', __name__, url_prefix='/api')
@@ -29,6 +35,12 @@ class AssessmentView(MethodView):
         """Delete an assessment ressource."""
         data = DATA()
         assessment = data.query(Assessment).get(identifier)
+
+        # Assessments merged from this one are computed again without it.
+        for derivation in assessment.derivations:
+            for source in derivation.merged.sources:
+                source.seen = None
+
         data.delete(assessment)
         data.commit()
         return jsonify(redirect=url_for('assessments.assessments'))
@@ -44,11 +56,146 @@ class GraderController(MethodView):
         """Adjust marks."""
         data = DATA()
         assessment = data.query(Assessment).get(identifier)
+        if assessment is None:
+            abort(404)
+        if assessment.merged:
+            abort(409)
         assessment.grade(grader)
         data.commit()
         return jsonify(redirect=url_for('assessments.results', identifier=identifier))
 
 
+class RankingView(MethodView):
+    """
+    API for ranking ressources.
+
+    Ranks are sent as columnar JSON: one array per requested field. Pages are
+    delimited by keyset pagination on (position, rank identifier): the 'next'
+    cursor of a page is given as the 'after' parameter to get the next one.
+
+    Query parameters:
+    - fields:   Comma separated list of fields among 'aid', 'score', 'value'
+                and 'position'. Default to all fields.
+    - after:    Cursor returned by the previous page.
+    - limit:    Integer. Maximal number of ranks of the page.
+    """
+
+    decorators = [conditional(assessment_version), login_required]
+    fields = {
+        'aid': Student.aid, 'score': Mark._score, 'value': Mark.value,
+        'position': Rank.position}
+    limit, maximum = 1000, 10000
+
+    def get(self, identifier, ranking):
+        """Fetch a page of a ranking."""
+        data = DATA()
+        if synchronize(identifier):
+            data.commit()
+        query = data.query(Assessment.precision)
+        query = query.join(Ranking, Ranking.assessment_id == Assessment.identifier)
+        precision = query.filter(
+            Assessment.identifier == identifier,
+            Ranking.identifier == ranking).scalar()
+        if precision is None:
+            abort(404)
+
+        fields = request.args.get('fields', ','.join(self.fields)).split(',')
+        if not fields or not set(fields) <= self.fields.keys():
+            abort(400)
+        limit = request.args.get('limit', self.limit, type=int)
+        limit = min(max(limit, 1), self.maximum)
+
+        columns = [self.fields[field] for field in fields]
+        query = data.query(Rank.identifier, Rank.position, *columns)
+        if {'aid', 'score', 'value'} & set(fields):
+            query = query.join(Mark, Rank.mark_id == Mark.identifier)
+        if 'aid' in fields:
+            query = query.join(Student, Mark.student_id == Student.identifier)
+        query = query.filter(Rank.ranking_id == ranking)
+
+        after = request.args.get('after')
+        if after:
+            try:
+                position, rank = (int(part) for part in after.split(','))
+            except ValueError:
+                abort(400)
+            query = query.filter(or_(
+                Rank.position > position,
+                and_(Rank.position == position, Rank.identifier > rank)))
+
+        query = query.order_by(Rank.position, Rank.identifier)
+        rows = query.limit(limit + 1).all()
+        following = len(rows) > limit
+        rows = rows[:limit]
+
+        page = {field: list() for field in fields}
+        for row in rows:
+            for field, value in zip(fields, row[2:]):
+                if field in ('score', 'value'):
+                    value = round(value, precision)
+                page[field].append(value)
+        page['next'] = '{},{}'.format(rows[-1][1], rows[-1][0]) if following else None
+        return jsonify(page)
+
+
+class StudentResultView(MethodView):
+    """
+    API for the result of a single student to an assessment.
+
+    Only indexed lookups are made: the mark of the student, then its rank in
+    each ranking of the assessment. Percentiles are computed with a binary
+    search in sorted values of the rankings, which are cached for each
+    version of the assessment. Students can only access their own result.
+    """
+
+    decorators = [conditional(assessment_version), login_required]
+
+    @staticmethod
+    def get(identifier, aid):
+        """Fetch the mark, positions and percentiles of a student."""
+        profile = getattr(current_user, 'profile', None)
+        if getattr(profile, 'role', None) == 'student' and profile.aid != aid:
+            abort(403)
+
+        data = DATA()
+        if synchronize(identifier):
+            data.commit()
+        assessment = data.query(Assessment).get(identifier)
+        query = data.query(
+            Mark.identifier, Mark._score.label('score'), Mark.value.label('value'))
+        query = query.join(Student, Mark.student_id == Student.identifier)
+        mark = query.filter(
+            Mark.assessment_id == identifier, Student.aid == aid).first()
+        if assessment is None or mark is None:
+            abort(404)
+
+        query = data.query(
+            Ranking.identifier, Ranking.group_id, Group.name, Rank.position)
+        query = query.join(Rank, and_(
+            Rank.ranking_id == Ranking.identifier,
+            Rank.mark_id == mark.identifier))
+        query = query.outerjoin(Group, Group.identifier == Ranking.group_id)
+        query = query.filter(Ranking.assessment_id == identifier)
+
+        precision = assessment.precision
+        rankings = list()
+        for ranking, group_id, group, position in query.order_by(Ranking.identifier):
+            if group_id is None:
+                values = assessment.values
+            else:
+                values = sorted_values(data, ranking, assessment.version)
+            rank = percentile(values, mark.value)
+            rankings.append({
+                'ranking': ranking, 'group': group, 'position': position,
+                'size': len(values),
+                'percentile': round(rank, 1) if rank is not None else None})
+
+        return jsonify(
+            aid=aid, score=round(mark.score, precision),
+            value=round(mark.value, precision), scale=assessment.scale,
+            rankings=rankings)
+
+
 class GroupView(MethodView):
     """API for group ressources."""
 
@@ -79,10 +226,30 @@ class UserView(MethodView):
         return jsonify(redirect=url_for('users.users'))
 
 
+class CacheView(MethodView):
+    """API for fragment cache instrumentation, for administrators only."""
+
+    decorators = [login_required]
+
+    @staticmethod
+    def get():
+        """Hit rates of the fragment cache of the current worker."""
+        profile = getattr(current_user, 'profile', None)
+        if getattr(profile, 'role', None) != 'administrator':
+            abort(403)
+        return jsonify(FRAGMENTS.statistics())
+
+
 # Register routes to controllers.
 BLUEPRINT.add_url_rule(
     '/assessments/<int:identifier>',
     view_func=AssessmentView.as_view('assessment'))
+BLUEPRINT.add_url_rule(
+    '/assessments/<int:identifier>/rankings/<int:ranking>',
+    view_func=RankingView.as_view('ranking'))
+BLUEPRINT.add_url_rule(
+    '/assessments/<int:identifier>/students/<int:aid>',
+    view_func=StudentResultView.as_view('student_result'))
 BLUEPRINT.add_url_rule(
     '/assessments/<int:identifier>/marks/grader/<grader>',
     view_func=GraderController.as_view('grade'))
@@ -92,3 +259,6 @@ BLUEPRINT.add_url_rule(
 BLUEPRINT.add_url_rule(
     '/users/<int:identifier>',
     view_func=UserView.as_view('user'))
+BLUEPRINT.add_url_rule(
+    '/cache',
+    view_func=CacheView.as_view('cache'))
@@ -14,8 +14,9 @@ from flask.views import MethodView
 from flask_login import login_required
 from linnote.core.user import Group, User, Administrator, Profile
 from linnote.core.utils import DATA
+from linnote.core.utils.http import conditional
 from .forms import GroupForm, GroupCreationForm, UserForm
-from .logic import load_group
+from .logic import group_version, load_group
 
 
 class GroupsController(MethodView):
@@ -106,6 +107,7 @@ class GroupSettingsController(GroupBaseController):
         group = self.load(identifier)
         form = GroupForm()
         group.name = form.name.data
+        group.touch()
         data.commit()
         return self.get(identifier=identifier)
 
@@ -113,6 +115,7 @@ class GroupSettingsController(GroupBaseController):
 class GroupMembersController(GroupBaseController):
     """Controls the view of group's members."""
 
+    decorators = [conditional(group_version), login_required]
     template = 'users/groups/group/members.html'
 
     def get(self, identifier):
@@ -219,7 +222,11 @@ class UserController(UserBaseController):
             user.firstname = form.firstname.data
             user.lastname = form.lastname.data
             user.email = form.email.data
-            user.groups = [data.query(Group).get(id) for id in form.groups.data]
+            user.touch()
+            selected = [data.query(Group).get(id) for id in form.groups.data]
+            for group in set(user.groups) | set(selected):
+                group.touch()
+            user.groups = selected
 
         data.commit()
         return self.render(form=form, user=user)
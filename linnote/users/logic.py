@@ -9,13 +9,17 @@ License: Mozilla Public License, see 'LICENSE.txt' for details.
 """
 
 from pathlib import Path
-from pandas import read_excel
+from sqlalchemy import func
 from linnote.core.user import Group, Student, User
+from linnote.core.utils import DATA
+from linnote.core.utils.tabular import read
 
 
 def load_group(file: Path, name: str = None) -> Group:
     """
-    Load a student group from an excel file.
+    Load a student group from a tabular file.
+
+    The file is read by chunks, see 'linnote.core.utils.tabular'.
 
     - file: A path-like object. The path to the file.
     - name: String. The group's name.
@@ -25,12 +29,40 @@ def load_group(file: Path, name: str = None) -> Group:
     fields = ['identifier', 'firstname', 'lastname', 'email']
     types = {'identifier': int}
 
-    records = read_excel(file, names=fields, dtypes=types)
-    records = records.to_dict('records')
-
     group = Group(name=name)
-    for record in records:
-        user = User(record['firstname'], record['lastname'], record['email'])
-        Student(identity=user, aid=record['identifier'])
-        group.append(user)
+    for records in read(file, fields, types):
+        users = list()
+        for record in records:
+            user = User(record['firstname'], record['lastname'], record['email'])
+            Student(identity=user, aid=record['identifier'])
+            users.append(user)
+        group.extend(users)
     return group
+
+
+def group_version(identifier: int, **_) -> str:
+    """
+    Version of a group, read without loading the group.
+
+    Return: A string, or None if the group does not exist.
+    """
+    data = DATA()
+    query = data.query(Group.version).filter(Group.identifier == identifier)
+    version = query.scalar()
+    if version is None:
+        return None
+    return '{}-{}'.format(identifier, version)
+
+
+def identities_version() -> int:
+    """
+    Version of users' details, read without loading users.
+
+    Versions only increase and removed users lower the sum, so the sum
+    changes whenever a user is modified, added or removed.
+
+    Return: An integer.
+    """
+    data = DATA()
+    query = data.query(func.coalesce(func.sum(User.version), 0))
+    return query.scalar()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test fixtures.
+
+The database engine is created from 'configuration.ini' when linnote is
+imported: tests run from a temporary directory holding a configuration with
+an in-memory SQLite database, and without fragment cache.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+import os
+from pathlib import Path
+from tempfile import mkdtemp
+import pytest
+
+
+CONFIGURATION = """
+[FLASK]
+SECRET_KEY = testing
+FRAGMENT_CACHE_SIZE = 0
+
+[DATABASE]
+URL = sqlite://
+"""
+
+DIRECTORY = Path(mkdtemp())
+(DIRECTORY / 'configuration.ini').write_text(CONFIGURATION)
+os.chdir(DIRECTORY)
+
+# pylint: disable=C0413
+from linnote import create_app
+from linnote import account, assessments, services, users
+from linnote.core.utils import BASE, DATA
+from linnote.core.utils.database import ENGINE
+
+
+@pytest.fixture
+def app():
+    """Application instance with an empty database."""
+    BASE.metadata.create_all(ENGINE)
+    application = create_app(
+        'linnote', blueprints=[account, assessments, services, users])
+    application.config.update(TESTING=True, LOGIN_DISABLED=True)
+    with application.app_context():
+        yield application
+        DATA.remove()
+    BASE.metadata.drop_all(ENGINE)
+
+
+@pytest.fixture
+def client(app):
+    """Test client of the application."""
+    return app.test_client()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the rankings view.
+
+Author: Anatole Hanniet, 2016-2018.
+License: Mozilla Public License, see 'LICENSE.txt' for details.
+"""
+
+from sqlalchemy import event
+from linnote.assessments.logic import rank, save_rankings
+from linnote.core.assessment import Assessment, Mark
+from linnote.core.user import Group, Student, User
+from linnote.core.utils import DATA
+from linnote.core.utils.database import ENGINE
+
+
+def ranked_assessment(size: int, groups: int = 3) -> int:
+    """
+    Store an assessment of 'size' students, ranked in general and by group.
+
+    Return: The identifier of the assessment.
+    """
+    data = DATA()
+    groups = [Group(name='group {}-{}'.format(size, index))
+              for index in range(groups)]
+    students = list()
+    for index in range(size):
+        user = User('first', 'last {}'.format(index),
+                    '{}-{}@example.org'.format(size, index))
+        students.append(Student(identity=user, aid=size * 10000 + index))
+        groups[index % len(groups)].append(user)
+    data.add_all(groups)
+    data.flush()
+
+    assessment = Assessment('assessment {}'.format(size), 20)
+    data.add(assessment)
+    assessment.add_results(
+        [Mark(student, index % 21, 20) for index, student in enumerate(students)])
+    data.flush()
+    save_rankings(assessment, rank(assessment, groups))
+    data.commit()
+    return assessment.identifier
+
+
+def count_queries(client, url: str) -> int:
+    """Number of statements executed to render a page."""
+    statements = list()
+
+    def count(*_):
+        statements.append(None)
+
+    event.listen(ENGINE, 'before_cursor_execute', count)
+    try:
+        response = client.get(url)
+        assert response.status_code == 200
+        response.get_data()
+    finally:
+        event.remove(ENGINE, 'before_cursor_execute', count)
+    return len(statements)
+
+
+def test_rankings_queries_do_not_depend_on_ranks(client):
+    """Rendering rankings takes as many queries for 10 or 400 students."""
+    small = ranked_assessment(10)
+    large = ranked_assessment(400)
+    DATA.remove()
+
+    expected = count_queries(client, '/assessments/{}/rankings'.format(small))
+    assert count_queries(
+        client, '/assessments/{}/rankings'.format(large)) == expected
+    assert expected <= 10